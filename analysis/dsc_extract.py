@@ -1,13 +1,30 @@
 from dsc.query_engine import Query_Processor as dscQP
 from dsc import dsc_io
 import pandas as pd
+import concurrent.futures
 import numpy as np
 import os
+import sys
 
 from pymir import pd_utils
+from loader_cache import LoaderCache
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../dsc/functions"))
+from dataset import read_dataset
+from history import read_history
+from modelstore import LazyModel
+from predict import predict_linear_matrix
 
-def flex_read(filepath):
+# Memoized DSC output files, shared by all helpers of this module
+loader_cache = LoaderCache()
+
+
+def flex_read(filepath, cache = True):
+    '''
+    Read the DSC output filepath (.rds or .pkl).
+    With cache, the files are memoized (see loader_cache.py);
+    the returned dict is a copy, but the arrays in it are shared and should not be modified.
+    '''
     rds = f"{filepath}.rds"
     pkl = f"{filepath}.pkl"
     res = None
@@ -15,13 +32,39 @@ def flex_read(filepath):
         print(f"{filepath}")
         print(f"Both rds and pkl DSC output files exist; files should be cleaned up by running \"dsc --clean\"")
     elif os.path.isfile(rds):
-        res = dsc_io.load_dsc(rds)
+        res = loader_cache.load(rds, dsc_io.load_dsc) if cache else dsc_io.load_dsc(rds)
     elif os.path.isfile(pkl):
-        res = dsc_io.load_dsc(pkl)
+        res = loader_cache.load(pkl, dsc_io.load_dsc) if cache else dsc_io.load_dsc(pkl)
+    if isinstance(res, dict):
+        res = dict(res)
+    # large matrices of the model are read on demand
+    if isinstance(res, dict) and isinstance(res.get('model', None), dict) and 'heavy' in res['model']:
+        res['model'] = LazyModel(res['model'], dirname = os.path.dirname(filepath))
     return res
 
 
-def emvamp_mse_hist(dsc_outdir, method, dim, sfrac, pve, rho):
+def read_simulation(simpath):
+    '''
+    Read the output of a simulate module, along with the arrays
+    in its memory-mapped dataset. The manifest is looked up 
+    next to the output file, so that moved DSC output directories can be read.
+    '''
+    data = flex_read(simpath)
+    if data is not None and 'datafile' in data:
+        datafile = os.path.join(os.path.dirname(simpath), os.path.basename(data['datafile']))
+        data.update(read_dataset(datafile))
+    return data
+
+
+def emvamp_mse_hist(dsc_outdir, method, dim, sfrac, pve, rho, workers = 4, pool = 'thread', tidy = False):
+    '''
+    RMSE / sigma of the test predictions at every iteration of the EM-VAMP fits.
+    The fit and simulation files are read by a pool of workers (thread or process),
+    and all iterates of a fit are scored with one matrix product.
+    Returns a DataFrame with one row per (fit, iteration) if tidy,
+    where iter is the iteration of the checkpoint (see history.read_history),
+    otherwise a list of the per-fit arrays of scores.
+    '''
     target     = ["simulate", "fit"]
     conditions = [f"simulate.sfrac == {sfrac}",
                   f"simulate.dims == '({dim[0]},{dim[1]})'",
@@ -30,28 +73,40 @@ def emvamp_mse_hist(dsc_outdir, method, dim, sfrac, pve, rho):
                  ]
     groups     = None
     dbpath     = os.path.join(dsc_outdir, os.path.basename(os.path.normpath(dsc_outdir)) + ".db")
-    allscores  = list()
     qp         = dscQP(dbpath, target, conditions, groups)
     outdf      = pd_utils.select_dfrows(qp.output_table, [f"$(fit) == {method}"])
-    for idx in outdf.index.to_numpy():
-        fitpath    = os.path.join(dsc_outdir, outdf.loc[idx, 'fit.output.file'])
-        simpath    = os.path.join(dsc_outdir, outdf.loc[idx, 'simulate.output.file'])
-        resdict    = flex_read(fitpath)
-        datadict   = flex_read(simpath)
-        bhat_hist  = resdict['model']
-        Xtest      = datadict['Xtest']
-        ytest      = datadict['ytest']
-        se         = datadict['se']
-        niter      = len(bhat_hist)
-        scores     = np.zeros(niter)
-        n, p       = Xtest.shape
-        for it in range(niter):
-            bhati  = bhat_hist[it]
-            ypred  = np.dot(Xtest, bhati[1:]) + bhati[0]
-            rmse   = np.sqrt(np.mean((ytest.reshape(n,1) - ypred)**2))
-            scores[it] = rmse / se
-        allscores.append(scores)
-    return allscores
+    tasks      = [(os.path.join(dsc_outdir, outdf.loc[idx, 'fit.output.file']),
+                   os.path.join(dsc_outdir, outdf.loc[idx, 'simulate.output.file'])) for idx in outdf.index.to_numpy()]
+    executor   = concurrent.futures.ThreadPoolExecutor if pool == 'thread' else concurrent.futures.ProcessPoolExecutor
+    with executor(max_workers = workers) as ex:
+        results = list(ex.map(_emvamp_score_hist, *zip(*tasks))) if len(tasks) > 0 else list()
+    allscores  = [x[1] for x in results]
+    if not tidy:
+        return allscores
+    scoredf    = pd.DataFrame({'fit':        np.repeat(np.arange(len(allscores)), [x.shape[0] for x in allscores]),
+                               'iter':       np.concatenate([np.asarray(x[0], dtype = int) for x in results] + [np.zeros(0, dtype = int)]),
+                               'rmse_sigma': np.concatenate(allscores + [np.zeros(0)])})
+    scoredf['fit.output.file'] = [os.path.relpath(tasks[i][0], dsc_outdir) for i in scoredf['fit']]
+    scoredf['method'] = method
+    scoredf['n'], scoredf['p'] = dim[0], dim[1]
+    scoredf['sfrac'], scoredf['pve'], scoredf['rho'] = sfrac, pve, rho
+    return scoredf
+
+
+def _emvamp_score_hist(fitpath, simpath):
+    '''
+    Returns the iterations of the checkpoints and their RMSE / sigma.
+    '''
+    resdict      = flex_read(fitpath)
+    datadict     = read_simulation(simpath)
+    iters, bhat_hist = read_history(resdict['model'], dirname = os.path.dirname(fitpath))
+    Xtest        = datadict['Xtest']
+    n, p         = Xtest.shape
+    # T iterates in the columns, n x T predictions
+    bhat_hist    = np.asarray(bhat_hist)
+    ypred        = predict_linear_matrix(Xtest, bhat_hist[:, 0], bhat_hist[:, 1:].T)
+    rmse         = np.sqrt(np.mean((datadict['ytest'].reshape(n, 1) - ypred)**2, axis = 0))
+    return iters, rmse / datadict['se']
 
 def changepoint_predictions(dsc_outdir, methods, order = 0, sfix = 1, dsc_iter = 1):
     dbpath     = os.path.join(dsc_outdir, os.path.basename(os.path.normpath(dsc_outdir)) + ".db")
@@ -77,7 +132,7 @@ def changepoint_predictions(dsc_outdir, methods, order = 0, sfix = 1, dsc_iter =
         ypred[method]  = pred['yest']
         b1pred[method] = fit['beta_est']
         b0pred[method] = fit['intercept']
-    data = flex_read(simpath0)
+    data = read_simulation(simpath0)
     X = data['X']
     y = data['y']
     beta = data['beta']
@@ -1,33 +1,130 @@
 import os
 import subprocess
 import tempfile
+import hashlib
+import json
 import pandas as pd
 from dsc import dsc_io
+from dsc.query_engine import Query_Processor as dscQP
 
-import rpy2.robjects as robj
-import rpy2.robjects.vectors as rvec
-from rpy2.robjects.packages import importr 
-from rpy2.robjects.conversion import localconverter
-from rpy2.robjects import numpy2ri
-numpy2ri.activate()
-from rpy2.robjects import pandas2ri
-pandas2ri.activate()
+from dsc_extract import flex_read
 
 
 '''
-A Python wrapper for the dscquery in R
-Brute force method which saves a temporary RDS file 
-and loads it in Python.
-See below for a rpy2 implementation,
-which does not work with pkl files.
+Query the DSC results, as dscrutils::dscquery in R.
+By default, the query is done by the R dscquery (see _rscript_dscquery).
+With native = True, the query runs in Python (see _native_dscquery),
+and the results are cached in cache_dir (default: .dscquery_cache in dsc_outdir;
+False disables the cache). The native output is compared with the R output
+on the queries of the notebooks in test_dscquery.py.
 '''
 def dscquery(dsc_outdir, targets,
              conditions = None,
              groups = None,
              verbose = True,
-             sep = "::",
-             dolr = "##"
+             native = False,
+             cache_dir = None
             ):
+    if not native:
+        return _rscript_dscquery(dsc_outdir, targets, conditions = conditions, groups = groups, verbose = verbose)
+    dbpath = os.path.join(dsc_outdir, os.path.basename(os.path.normpath(dsc_outdir)) + ".db")
+    if cache_dir is None:
+        cache_dir = os.path.join(dsc_outdir, ".dscquery_cache")
+    if cache_dir is False:
+        return _native_dscquery(dsc_outdir, dbpath, targets, conditions, groups)
+    key    = query_key(dsc_outdir, dbpath, targets, conditions, groups)
+    dscout = _read_cached_query(cache_dir, key)
+    if dscout is None:
+        dscout = _native_dscquery(dsc_outdir, dbpath, targets, conditions, groups)
+        _write_cached_query(cache_dir, key, dscout)
+    elif verbose:
+        print(f"Loaded cached query {key}")
+    return dscout
+
+
+def _native_dscquery(dsc_outdir, dbpath, targets, conditions, groups):
+    return load_outputs(dsc_outdir, query_table(dbpath, targets, conditions, groups))
+
+
+def query_table(dbpath, targets, conditions = None, groups = None):
+    '''
+    Table of the Query_Processor, with the file of every module output
+    in the columns "<module>.<variable>:output".
+    '''
+    return dscQP(dbpath, targets, conditions, groups).output_table.copy()
+
+
+def load_outputs(dsc_outdir, dscout):
+    '''
+    As in dscrutils::dscquery, the columns "<module>.<variable>:output" are replaced
+    by the columns "<module>.<variable>" with the values read from the output files.
+    '''
+    for col in [x for x in dscout.columns if x.endswith(":output")]:
+        name     = col[:-len(":output")]
+        variable = name.split(".", 1)[1]
+        values   = list()
+        for outfile in dscout[col]:
+            res  = flex_read(os.path.join(dsc_outdir, outfile)) if isinstance(outfile, str) else None
+            values.append(None if res is None else res.get(variable, None))
+        dscout.insert(dscout.columns.get_loc(col), name, values)
+        dscout = dscout.drop(columns = col)
+    return dscout
+
+
+def query_key(dsc_outdir, dbpath, targets, conditions, groups):
+    '''
+    The query is identified by the output directory, the targets, conditions and groups,
+    and the modification time of the database.
+    '''
+    query = json.dumps([os.path.abspath(dsc_outdir), targets, conditions, groups, os.stat(dbpath).st_mtime_ns])
+    return hashlib.blake2b(query.encode(), digest_size = 16).hexdigest()
+
+
+def _read_cached_query(cache_dir, key):
+    '''
+    Cached results are columnar (parquet) files if pyarrow can store the table,
+    otherwise pickle files.
+    '''
+    for ext in ["parquet", "pkl"]:
+        path = os.path.join(cache_dir, f"{key}.{ext}")
+        if os.path.isfile(path):
+            try:
+                return pd.read_parquet(path) if ext == "parquet" else pd.read_pickle(path)
+            except Exception:
+                # incomplete or unreadable cache file; query again
+                return None
+    return None
+
+
+def _write_cached_query(cache_dir, key, dscout):
+    os.makedirs(cache_dir, exist_ok = True)
+    fd, tmpfile = tempfile.mkstemp(dir = cache_dir, suffix = ".tmp")
+    os.close(fd)
+    try:
+        dscout.to_parquet(tmpfile)
+        ext = "parquet"
+    except Exception:
+        # pyarrow is not installed, or the table has values which parquet cannot store
+        dscout.to_pickle(tmpfile, protocol = 5)
+        ext = "pkl"
+    os.replace(tmpfile, os.path.join(cache_dir, f"{key}.{ext}"))
+    return
+
+
+'''
+A Python wrapper for the dscquery in R
+Brute force method which saves a temporary RDS file 
+and loads it in Python.
+See below for a rpy2 implementation,
+which does not work with pkl files.
+'''
+def _rscript_dscquery(dsc_outdir, targets,
+                      conditions = None,
+                      groups = None,
+                      verbose = True,
+                      sep = "::",
+                      dolr = "##"
+                     ):
 
     os_handle, \
         rds_file = tempfile.mkstemp(suffix = ".rds")
@@ -78,6 +175,14 @@ def _dscquery(dsc_output, targets,
               conditions = None,
               verbose = True
              ):
+    import rpy2.robjects as robj
+    import rpy2.robjects.vectors as rvec
+    from rpy2.robjects.packages import importr 
+    from rpy2.robjects.conversion import localconverter
+    from rpy2.robjects import numpy2ri
+    numpy2ri.activate()
+    from rpy2.robjects import pandas2ri
+    pandas2ri.activate()
     dscrutils    = importr('dscrutils')
     r_targets    = rvec.StrVector(targets)        if targets    is not None else robj.NULL
     r_conditions = rvec.StrVector(conditions)     if conditions is not None else robj.NULL
@@ -0,0 +1,130 @@
+#
+# Memoizing loader of DSC output files.
+#
+# The deserialized files are kept in memory, keyed on the path, the modification time
+# and the size of the file, so that a file changed by a new DSC run is read again.
+# The memory cache is a LRU bounded in (approximate) bytes.
+# Optionally, the deserialized objects are also stored in a sidecar directory
+# as pickle (protocol 5), which is much faster to load than .rds files,
+# and is reused across sessions.
+#
+# Environment variables:
+#     EBLINREG_LOADER_CACHE_SIZE=<bytes>    memory bound (default 1 GB)
+#     EBLINREG_LOADER_SIDECAR=<directory>   sidecar directory (default: none)
+#
+import numpy as np
+import pandas as pd
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+
+class LoaderCache:
+    '''
+    load(path, reader) returns reader(path), from the cache if the file has not changed.
+    The cached objects are shared: the callers must not modify them in place.
+    '''
+    def __init__(self, max_bytes = None, sidecar_dir = None):
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("EBLINREG_LOADER_CACHE_SIZE", 1024**3))
+        if sidecar_dir is None:
+            sidecar_dir = os.environ.get("EBLINREG_LOADER_SIDECAR", None)
+        self.max_bytes   = max_bytes
+        self.sidecar_dir = sidecar_dir
+        self.entries     = collections.OrderedDict()
+        self.nbytes      = 0
+        self.hits        = 0
+        self.misses      = 0
+        self._lock       = threading.Lock()
+
+    def load(self, path, reader):
+        stat = os.stat(path)
+        key  = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+        # read outside the lock, so that a pool of threads can load different files
+        obj  = self._read_sidecar(key)
+        if obj is None:
+            obj = reader(path)
+            self._write_sidecar(key, obj)
+        with self._lock:
+            self._insert(key, obj)
+        return obj
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def _insert(self, key, obj):
+        # drop the earlier versions of the same file
+        for old in [x for x in self.entries if x[0] == key[0]]:
+            self.nbytes -= self.entries.pop(old)[1]
+        size = object_nbytes(obj)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (obj, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, oldsize) = self.entries.popitem(last = False)
+            self.nbytes -= oldsize
+
+    def _sidecar_path(self, key):
+        name = hashlib.blake2b(f"{key[0]}".encode(), digest_size = 16).hexdigest()
+        return os.path.join(self.sidecar_dir, f"{name}.{key[1]}.{key[2]}.pkl")
+
+    def _read_sidecar(self, key):
+        if self.sidecar_dir is None:
+            return None
+        try:
+            with open(self._sidecar_path(key), 'rb') as fh:
+                return pickle.load(fh)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _write_sidecar(self, key, obj):
+        if self.sidecar_dir is None or obj is None:
+            return
+        # a failed write (objects which cannot be pickled, full or read-only disk)
+        # never breaks the read: the object is only cached in memory
+        tmpfile = None
+        try:
+            os.makedirs(self.sidecar_dir, exist_ok = True)
+            fd, tmpfile = tempfile.mkstemp(dir = self.sidecar_dir, suffix = ".tmp")
+            with os.fdopen(fd, 'wb') as fh:
+                pickle.dump(obj, fh, protocol = 5)
+            os.replace(tmpfile, self._sidecar_path(key))
+            tmpfile = None
+        except (pickle.PicklingError, TypeError, AttributeError, OSError):
+            pass
+        finally:
+            if tmpfile is not None:
+                try:
+                    os.remove(tmpfile)
+                except OSError:
+                    pass
+        return
+
+
+def object_nbytes(obj):
+    '''
+    Approximate memory of the arrays in a (nested) object.
+    '''
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(obj.memory_usage(deep = True).sum())
+    if isinstance(obj, dict):
+        return sum([object_nbytes(x) for x in obj.values()]) + 64 * len(obj)
+    if isinstance(obj, (list, tuple)):
+        return sum([object_nbytes(x) for x in obj]) + 8 * len(obj)
+    if isinstance(obj, (str, bytes)):
+        return len(obj)
+    return 64
@@ -1,34 +1,28 @@
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
-import numpy as np
 import math
 
 from pymir import mpl_stylesheet
 from pymir import mpl_utils
-from pymir import pd_utils
 
 import methodprops
+from summary_tables import summary_table, summary_value
 
 
 mpl_stylesheet.banskt_presentation()
 
-def single_plot_score_methods(ax, resdf, colname, methods, pve, rho, dims, sfracs, use_median = False):
+def single_plot_score_methods(ax, resdf, colname, methods, pve, rho, dims, sfracs, use_median = False, summary = None):
+    '''
+    summary is the summary_table of colname (computed from resdf if None).
+    '''
+    if summary is None:
+        summary = summary_table(resdf, [colname])
     xvals  = [max(1, int(x * dims[1])) for x in sfracs]
     xscale = 'log10'
     yscale = 'log10'
+    stat   = "median" if use_median else "mean"
     for method in methods:
-        score = [0 for x in sfracs]
-        mconditions  = [f"$(fit) == {method}"]
-        mconditions += [f"$(simulate.pve) == {pve}"]
-        mconditions += [f"$(simulate.rho) == {rho}"]
-        for i, sfrac in enumerate(sfracs):
-            sfrac_condition = f"$(simulate.sfrac) == {sfrac}"
-            dfselect = pd_utils.select_dfrows(resdf, mconditions + [sfrac_condition])
-            scores   = dfselect[colname].to_numpy()
-            if use_median:
-                score[i] = np.median(scores[~np.isnan(scores)])
-            else:
-                score[i] = np.mean(scores[~np.isnan(scores)])
+        score = [summary_value(summary, colname, stat, method, pve, rho, sfrac, dims = dims) for sfrac in sfracs]
 
         # Plot xvals vs score
         pm = methodprops.plot_metainfo()[method]
@@ -47,17 +41,17 @@ def single_plot_score_methods(ax, resdf, colname, methods, pve, rho, dims, sfrac
     return
 
 
-def single_plot_computational_time(ax, data, colname, whichmethods, pve, rho, dims, sfrac):
+def single_plot_computational_time(ax, data, colname, whichmethods, pve, rho, dims, sfrac, summary = None):
+    '''
+    summary is the summary_table of colname (computed from data if None).
+    '''
+    if summary is None:
+        summary = summary_table(data, [colname])
     yscale = 'linear'
     xscale = 'log10'
     ylabels = list()
     for i, method in enumerate(whichmethods):
-        # Select relevant rows
-        mconditions  = [f"$(fit) == {method}"]
-        mconditions += [f"$(simulate.pve) == {pve}"]
-        mconditions += [f"$(simulate.rho) == {rho}"]
-        mconditions += [f"$(simulate.sfrac) == {sfrac}"]
-        dfselect = pd_utils.select_dfrows(data, mconditions)
+        times = summary_value(summary, colname, "values", method, pve, rho, sfrac, dims = dims)
 
         # Plotting style
         pm           = methodprops.plot_metainfo()[method]
@@ -68,7 +62,6 @@ def single_plot_computational_time(ax, data, colname, whichmethods, pve, rho, di
                             markeredgewidth = 0, markeredgecolor = pm.color)
 
         # Boxplot
-        times = dfselect[colname].to_numpy()
         xx    = mpl_utils.scale_array(times, xscale)
         ax.boxplot(xx, positions = [i+1], showfliers = True, showcaps = False, widths = 0.6, 
                    vert=False, patch_artist=True, notch = False,
@@ -79,7 +72,7 @@ def single_plot_computational_time(ax, data, colname, whichmethods, pve, rho, di
         
         # Background barplot
         xleft = mpl_utils.scale_array(0.1, xscale)
-        xmean = mpl_utils.scale_array(np.mean(times), xscale) - xleft
+        xmean = mpl_utils.scale_array(summary_value(summary, colname, "mean", method, pve, rho, sfrac, dims = dims), xscale) - xleft
         ax.barh(i+1, xmean, left = xleft,
                 align='center', color = pm.color, linewidth = 0, height = 0.6, alpha = 0.2)
 
@@ -116,13 +109,15 @@ def create_figure_prediction_error(whichmethods, data, dims, rho_list, pve_list,
     gs.update(wspace=wspace, hspace=hspace)
 
     # Subplots
+    summary = summary_table(data, ['score1'])
     axlist = list()
     for i, pve in enumerate(pve_list):
         for j, rho in enumerate(rho_list):
             ax = fig.add_subplot(gs[i + 1, j])
 
             # Plot for this pve and rho
-            single_plot_score_methods(ax, data, 'score1', whichmethods, pve, rho, dims, sfracs, use_median = use_median)
+            single_plot_score_methods(ax, data, 'score1', whichmethods, pve, rho, dims, sfracs,
+                                      use_median = use_median, summary = summary)
             ax.tick_params(labelcolor = "#333333")
 
             # Subplot title
@@ -0,0 +1,61 @@
+#
+# Pre-aggregated summaries of the DSC results for the figures.
+#
+# The score and time columns are summarized in one grouped pass over the results,
+# indexed by (method, dims, pve, rho, sfrac), so that every panel of a figure
+# is a lookup in the index instead of a scan of the results table.
+# Works on the output of dscquery as well as on read_results of the warehouse.
+#
+import numpy as np
+import pandas as pd
+
+KEYS      = ["fit", "simulate.dims", "simulate.pve", "simulate.rho", "simulate.sfrac"]
+QUANTILES = [0.25, 0.75]
+
+
+def summary_table(resdf, columns, keys = KEYS, quantiles = QUANTILES):
+    '''
+    For every column, the number of non-missing values (<col>.count), the mean, the median,
+    the quantiles (e.g. <col>.q25) and the non-missing values themselves (<col>.values, for boxplots).
+    The index is made of the keys, which must all be columns of resdf:
+    a missing key would pool the settings which differ in that key.
+    '''
+    missing = [x for x in keys if x not in resdf.columns]
+    if len(missing) > 0:
+        raise KeyError(f"Key columns not in the results: {missing}")
+    grouped = resdf.groupby(keys, sort = True)
+    summary = dict()
+    for col in columns:
+        values = grouped[col]
+        summary[f"{col}.count"]  = values.count()
+        summary[f"{col}.mean"]   = values.mean()
+        summary[f"{col}.median"] = values.median()
+        for q in quantiles:
+            summary[f"{col}.q{int(round(q * 100))}"] = values.quantile(q)
+        # the groups are iterated in the order of the index
+        summary[f"{col}.values"] = pd.Series([x.dropna().to_numpy() for name, x in values],
+                                             index = summary[f"{col}.count"].index, dtype = object)
+    return pd.DataFrame(summary)
+
+
+def summary_row(summary, method, pve, rho, sfrac, dims = None):
+    '''
+    Summary of one setting, or None if there is no result for this setting.
+    dims is (n, p), as in the figures; it is required if the index has dims.
+    '''
+    setting = {"fit": method, "simulate.pve": pve, "simulate.rho": rho, "simulate.sfrac": sfrac}
+    if dims is not None:
+        setting["simulate.dims"] = f"({dims[0]},{dims[1]})"
+    names = summary.index.names
+    key   = tuple([setting[x] for x in names]) if len(names) > 1 else setting[names[0]]
+    try:
+        return summary.loc[key]
+    except KeyError:
+        return None
+
+
+def summary_value(summary, colname, stat, method, pve, rho, sfrac, dims = None):
+    row = summary_row(summary, method, pve, rho, sfrac, dims = dims)
+    if row is None:
+        return np.array([]) if stat == "values" else np.nan
+    return row[f"{colname}.{stat}"]
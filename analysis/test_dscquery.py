@@ -0,0 +1,75 @@
+#
+# Parity of the native (Python) dscquery with the R dscrutils::dscquery,
+# on the queries of the analysis notebooks.
+#
+# The DSC output directories are given by the environment variables
+#     DSCQUERY_TEST_LINREG=<dsc output of the linreg pipeline>
+#     DSCQUERY_TEST_CHANGEPOINT=<dsc output of the trendfilter pipeline>
+# and the queries of a pipeline are skipped if its variable is not set
+# (or if dsc / Rscript are not available).
+#
+# Usage (from this directory):
+#     python -m pytest -q test_dscquery.py
+#
+import numpy as np
+import pandas as pd
+import os
+import shutil
+import pytest
+
+pytest.importorskip("dsc")
+if shutil.which("Rscript") is None:
+    pytest.skip("Rscript is not available", allow_module_level = True)
+
+from dscrutils2py import dscquery
+
+
+LINREG_TARGETS = ["simulate", "simulate.dims", "simulate.se", "simulate.rho",
+                  "simulate.sfix", "simulate.pve", "fit", "fit.DSC_TIME", "mse.err"]
+VAMP_TARGETS   = ["simulate", "simulate.dims", "simulate.se", "simulate.rho",
+                  "simulate.sfrac", "simulate.pve", "fit", "fit.DSC_TIME", "mse.err"]
+CPT_TARGETS    = ["changepoint", "changepoint.dims", "changepoint.se", "changepoint.sfix",
+                  "changepoint.basis_k", "changepoint.snr",
+                  "fit_cpt", "fit_cpt.DSC_TIME", "mse.err"]
+
+# (pipeline, targets, conditions, groups), as in the notebooks
+QUERIES = [
+    ("DSCQUERY_TEST_LINREG",      LINREG_TARGETS, None, ["fit_cpt:"]),   # prediction_error_with_varying_dim_sparsity_pve_corr
+    ("DSCQUERY_TEST_LINREG",      VAMP_TARGETS,   None, None),           # em_vamp_convergence
+    ("DSCQUERY_TEST_CHANGEPOINT", CPT_TARGETS,    None, ["fit:"]),       # changepoint_prediction, mr_ash_changepoint_examples
+]
+
+
+def sorted_rows(df):
+    keys = [x for x in df.columns if df[x].map(lambda v: np.isscalar(v) or v is None).all()]
+    return df.sort_values(keys).reset_index(drop = True)
+
+
+def is_missing(x):
+    return x is None or (np.isscalar(x) and not isinstance(x, str) and np.isnan(x))
+
+
+def assert_same_value(x, y):
+    assert is_missing(x) == is_missing(y)
+    if is_missing(x):
+        return
+    if isinstance(x, str) or isinstance(y, str):
+        assert str(x) == str(y)
+    else:
+        np.testing.assert_allclose(np.asarray(x, dtype = float), np.asarray(y, dtype = float), rtol = 1e-12)
+
+
+@pytest.mark.parametrize("envvar, targets, conditions, groups", QUERIES)
+def test_native_matches_rscript(envvar, targets, conditions, groups):
+    dsc_outdir = os.environ.get(envvar, None)
+    if dsc_outdir is None:
+        pytest.skip(f"{envvar} is not set")
+    rout = dscquery(dsc_outdir, targets, conditions = conditions, groups = groups, verbose = False, native = False)
+    pout = dscquery(dsc_outdir, targets, conditions = conditions, groups = groups, verbose = False, native = True,
+                    cache_dir = False)
+    assert list(pout.columns) == list(rout.columns)
+    assert pout.shape == rout.shape
+    rout, pout = sorted_rows(rout), sorted_rows(pout)
+    for col in rout.columns:
+        for x, y in zip(rout[col], pout[col]):
+            assert_same_value(x, y)
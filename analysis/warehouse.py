@@ -0,0 +1,129 @@
+#
+# Columnar warehouse of the DSC results.
+#
+# All rows of simulate * fit * predict * score and changepoint * fit_cpt * predict * score,
+# with the scores, the DSC timings and the simulation parameters, are flattened into a Parquet dataset
+# partitioned by the simulate and fit modules (hive layout, e.g. simulate=indepgauss/fit=lasso/).
+# Rows are identified by the output file of the score module;
+# an export after "rundsc.sh append" writes only the rows which are not yet in the warehouse.
+# The plotting helpers can then read the warehouse with predicate pushdown, e.g.
+#     read_results(warehouse_dir, filters = [("fit", "in", ["lasso", "ridge"]), ("p", "==", 10000)])
+# instead of querying the DSC database.
+# The query groups map changepoint to simulate and fit_cpt to fit,
+# so that both pipelines share the columns and the partitions (e.g. simulate=changepoint/fit=lasso/).
+#
+# Usage:
+#     python warehouse.py <dsc_outdir> <warehouse_dir>
+#
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as pads
+import pyarrow.parquet as pq
+import os
+import sys
+import time
+import uuid
+
+from dscrutils2py import query_table, load_outputs
+
+TARGETS   = ["simulate", "simulate.dims", "simulate.se", "simulate.rho", "simulate.sfix",
+             "simulate.sfrac", "simulate.pve", "simulate.snr", "simulate.basis_k", "simulate.DSC_TIME",
+             "fit", "fit.DSC_TIME",
+             "predict", "predict.DSC_TIME",
+             "score", "score.err", "score.DSC_TIME"]
+# the modules of fit_cpt are also modules of fit (see the define block of linreg.dsc)
+GROUPS    = ["simulate: indepgauss, equicorrgauss, changepoint",
+             "fit: ridge, lasso, elastic_net, lasso_1se, elastic_net_1se, scad, mcp, l0learn, "
+             "susie, varbvs, varbvsmix, blasso, bayesb, mr_ash, mr_ash_init, em_vamp, em_vamp_ash, "
+             "ebmr_ash, ebmr_lasso, ebmr_ashR, em_iridge",
+             "fit_cpt:"]
+PARTITION = ["simulate", "fit"]
+ROW_ID    = "score.output.file"
+# integer columns; the other columns are stored as float64 if numeric, else as strings,
+# so that every export has the same schema
+INTEGERS  = ["DSC", "replicate", "n", "p", "simulate.sfix", "simulate.basis_k"]
+
+
+def export_results(dsc_outdir, warehouse_dir, targets = TARGETS, conditions = None, groups = GROUPS,
+                   partition_cols = PARTITION, row_id = ROW_ID):
+    '''
+    Append the rows of the query (targets, conditions, groups) which are not yet in the warehouse.
+    Only the outputs of the new rows are read.
+    Returns the number of rows written.
+    '''
+    dbpath = os.path.join(dsc_outdir, os.path.basename(os.path.normpath(dsc_outdir)) + ".db")
+    table  = query_table(dbpath, targets, conditions, groups)
+    known  = existing_ids(warehouse_dir, row_id)
+    table  = table.loc[~table[row_id].isin(known)].reset_index(drop = True)
+    if table.shape[0] == 0:
+        return 0
+    table  = flatten_results(load_outputs(dsc_outdir, table), partition_cols)
+    stamp  = time.strftime("%Y%m%d%H%M%S")
+    pq.write_to_dataset(pa.Table.from_pandas(table, preserve_index = False), warehouse_dir,
+                        partition_cols = partition_cols,
+                        basename_template = f"part-{stamp}-{uuid.uuid4().hex[:8]}-{{i}}.parquet")
+    return table.shape[0]
+
+
+def existing_ids(warehouse_dir, row_id = ROW_ID):
+    if not os.path.isdir(warehouse_dir):
+        return set()
+    dataset = pads.dataset(warehouse_dir, format = "parquet", partitioning = "hive")
+    return set(dataset.to_table(columns = [row_id]).column(row_id).to_pylist())
+
+
+def flatten_results(table, partition_cols = PARTITION):
+    '''
+    One value per cell:
+    the outputs of length 1 become scalars, the dimensions "(n,p)" become the columns n and p,
+    and the replicate is the DSC column.
+    '''
+    table = table.copy()
+    for col in table.columns:
+        if table[col].dtype == object:
+            table[col] = [_scalar(x) for x in table[col]]
+    if "simulate.dims" in table.columns:
+        dims = [[int(x) for x in str(d).strip("()").split(",")] for d in table["simulate.dims"]]
+        table["n"] = [x[0] for x in dims]
+        table["p"] = [x[1] for x in dims]
+    if "DSC" in table.columns:
+        table["replicate"] = table["DSC"]
+    for col in table.columns:
+        if col in partition_cols:
+            table[col] = table[col].astype(str)
+        elif col in INTEGERS:
+            table[col] = pd.to_numeric(table[col], errors = 'coerce').astype("Int64")
+        else:
+            numeric = pd.to_numeric(table[col], errors = 'coerce')
+            if numeric.notna().sum() == table[col].notna().sum():
+                table[col] = numeric.astype(np.float64)
+            else:
+                table[col] = table[col].astype("string")
+    return table
+
+
+def _scalar(x):
+    if isinstance(x, np.ndarray) and x.size == 1:
+        return x.item()
+    if isinstance(x, (list, tuple)) and len(x) == 1:
+        return x[0]
+    return x
+
+
+def read_results(warehouse_dir, filters = None, columns = None):
+    '''
+    Read the warehouse as a DataFrame with the columns of dscquery.
+    The row filters and the column selection are pushed down to the Parquet reader.
+    '''
+    res = pd.read_parquet(warehouse_dir, filters = filters, columns = columns)
+    for col in res.columns:
+        # partition columns are read as categories
+        if isinstance(res[col].dtype, pd.CategoricalDtype):
+            res[col] = res[col].astype(str)
+    return res
+
+
+if __name__ == "__main__":
+    nrow = export_results(sys.argv[1], sys.argv[2])
+    print(f"Exported {nrow} new rows to {sys.argv[2]}")
@@ -0,0 +1,84 @@
+#
+# Check that the batched ridge fit (fit_ebmr_batch / fit_ridge_batch)
+# is the same fit as EBMR with the point prior (fit_ebmr_base, prior = 'point').
+#
+# Both are empirical Bayes ridge regression of y on [1, X],
+#     b ~ N(0, s2 sb2 I),  e ~ N(0, s2 I),
+# whose (s2, sb2) are the maximum of the marginal likelihood.
+# For every response, the table reports the (s2, sb2) of
+#   ml:    direct maximization of the marginal likelihood, in the SVD basis of [1, X]
+#   batch: fit_ebmr_batch
+#   ebmr:  fit_ebmr_base with prior = 'point'
+# and the largest relative difference of the coefficients of batch and ebmr.
+#
+# Usage (from this directory):
+#     python ebmr_point.py [--dims 500x200 100x500] [--rho 0.5] [--nrep 2] [--max-iter 20000]
+#
+import numpy as np
+import argparse
+import os
+import sys
+from scipy.optimize import minimize_scalar
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../dsc/functions"))
+import simulate
+import fit
+
+
+def marginal_ml(X, y):
+    '''
+    (s2, sb2) maximizing the marginal likelihood, y - mean(y) ~ N(0, s2 (I + sb2 A A^T)), A = [1, X],
+    with s2 profiled out.
+    '''
+    n      = X.shape[0]
+    A      = np.column_stack([np.ones(n), X])
+    U, s, _ = np.linalg.svd(A, full_matrices = False)
+    d      = s**2
+    yc     = y - np.mean(y)
+    z      = np.dot(U.T, yc)
+    rperp  = np.dot(yc, yc) - np.dot(z, z)
+    def s2_of(sb2):
+        return (np.sum(z**2 / (1 + sb2 * d)) + rperp) / n
+    def nll(t):
+        sb2 = np.exp(t)
+        return 0.5 * (n * np.log(s2_of(sb2)) + np.sum(np.log(1 + sb2 * d)))
+    res    = minimize_scalar(nll, bounds = (-20, 10), method = 'bounded', options = dict(xatol = 1e-10))
+    sb2    = np.exp(res.x)
+    return s2_of(sb2), sb2
+
+
+def compare(n, p, rho, nrep, max_iter):
+    # one design, nrep responses with different coefficients
+    rng  = np.random.default_rng(0)
+    X    = simulate.equicorr_predictors(n, p, 10, 0.5, rho = rho, rng = rng)[0]
+    Y    = list()
+    for j in range(nrep):
+        beta = simulate.sample_betas(p, rng.choice(p, 10, replace = False), rng = rng)
+        Y.append(simulate.get_responses(X, beta, simulate.get_sd_from_pve(X, beta, 0.5), rng = rng))
+    Y    = np.column_stack(Y)
+    batch, _, Bbatch = fit.fit_ebmr_batch(X, Y, prior = 'point', max_iter = max_iter, tol = 1e-12)
+    rows = list()
+    for j in range(nrep):
+        s2_ml, sb2_ml = marginal_ml(X, Y[:, j])
+        ebmr, _, bebmr = fit.fit_ebmr_base(X, Y[:, j], prior = 'point', max_iter = max_iter, tol = 1e-12)
+        rows.append(dict(n = n, p = p, response = j,
+                         s2_ml = s2_ml, sb2_ml = sb2_ml,
+                         s2_batch = batch['s2'][j], sb2_batch = batch['sb2'][j],
+                         s2_ebmr = float(ebmr['s2']), sb2_ebmr = float(ebmr['sb2']),
+                         coef_reldiff = np.max(np.abs(Bbatch[:, j] - bebmr)) / np.max(np.abs(bebmr))))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Batched ridge against EBMR with the point prior.")
+    parser.add_argument("--dims",     nargs = '+', default = ["500x200", "100x500"])
+    parser.add_argument("--rho",      type = float, default = 0.5)
+    parser.add_argument("--nrep",     type = int, default = 2)
+    parser.add_argument("--max-iter", type = int, default = 20000)
+    opts = parser.parse_args()
+    cols = ['n', 'p', 'response', 's2_ml', 'sb2_ml', 's2_batch', 'sb2_batch', 's2_ebmr', 'sb2_ebmr', 'coef_reldiff']
+    print("\t".join(cols))
+    for dims in opts.dims:
+        n, p = [int(x) for x in dims.split("x")]
+        for row in compare(n, p, opts.rho, opts.nrep, opts.max_iter):
+            print("\t".join([f"{row[x]:.6g}" if isinstance(row[x], float) else f"{row[x]}" for x in cols]))
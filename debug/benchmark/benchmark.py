@@ -0,0 +1,165 @@
+#
+# Microbenchmarks of the simulate and fit functions on the shapes of linreg.dsc.
+#
+# Every case is run --repeat times; the report has the median / minimum wall time
+# and the peak of the traced allocations (tracemalloc, which includes numpy arrays) of one run.
+# Against a saved baseline, a case is a regression if its median time exceeds
+# the baseline by more than --time-threshold, or its peak memory by more than --mem-threshold
+# (relative, for time also by more than --min-time seconds), and the script then exits with status 1.
+#
+# Usage (from this directory):
+#     python benchmark.py --save-baseline                 # save baseline.json for this machine
+#     python benchmark.py --report report.json            # compare with baseline.json
+#     python benchmark.py --filter fit_em_vamp --repeat 5
+# Baselines depend on the machine; save one on the nodes of the cluster run.
+#
+import numpy as np
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../dsc/functions"))
+import simulate
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+
+# Shapes of the simulate modules in linreg.dsc
+EQUICORR_DIMS    = [(500, 200), (500, 10000)]
+CHANGEPOINT_DIMS = [(200, 500)]
+BASIS_K          = [0, 1, 2]
+
+
+def equicorr_data(n, p):
+    return simulate.equicorr_predictors(n, p, 10, 0.5, rho = 0.95, rng = simulate.replicate_rngs(0, 1)[0])
+
+
+def changepoint_data(n, p, k):
+    return simulate.changepoint_predictors(n, p, 4, 20, k = k, signal = "gamma",
+                                           rng = simulate.replicate_rngs(0, 1)[0])
+
+
+def fit_cases():
+    '''
+    Cases of the fit wrappers, as (name, params, setup, run).
+    '''
+    import fit
+    methods = [
+        ('fit_ebmr_base', lambda X, y: fit.fit_ebmr_base(X, y, prior = 'mix_point')),
+        ('fit_iridge',    lambda X, y: fit.fit_iridge(X, y)),
+        ('fit_em_vamp',   lambda X, y: fit.fit_em_vamp(X, y)),
+    ]
+    cases = list()
+    for name, func in methods:
+        for n, p in EQUICORR_DIMS:
+            cases.append((name, dict(design = "equicorr", n = n, p = p),
+                          lambda n = n, p = p: equicorr_data(n, p)[:2],
+                          lambda data, func = func: func(*data)))
+        for n, p in CHANGEPOINT_DIMS:
+            for k in BASIS_K:
+                cases.append((name, dict(design = "changepoint", n = n, p = p, k = k),
+                              lambda n = n, p = p, k = k: changepoint_data(n, p, k)[:2],
+                              lambda data, func = func: func(*data)))
+    return cases
+
+
+def simulate_cases():
+    cases = list()
+    for n, p in EQUICORR_DIMS:
+        cases.append(('equicorr_predictors', dict(n = n, p = p), lambda: None,
+                      lambda data, n = n, p = p: equicorr_data(n, p)))
+    for n, p in CHANGEPOINT_DIMS:
+        for k in BASIS_K:
+            cases.append(('changepoint_predictors', dict(n = n, p = p, k = k), lambda: None,
+                          lambda data, n = n, p = p, k = k: changepoint_data(n, p, k)))
+            cases.append(('trend_filtering_basis', dict(n = n, p = p, k = k), lambda: None,
+                          lambda data, n = n, p = p, k = k: simulate.trend_filtering_basis(n, p, k)))
+    return cases
+
+
+def case_id(name, params):
+    return name + "[" + ",".join([f"{x}={v}" for x, v in params.items()]) + "]"
+
+
+def measure(setup, run, repeat):
+    data  = setup()
+    # the traced run is also the warm-up (imports, caches) of the timed runs
+    tracemalloc.start()
+    run(data)
+    peak  = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times = list()
+    for i in range(repeat):
+        start = time.perf_counter()
+        run(data)
+        times.append(time.perf_counter() - start)
+    return dict(time_median = float(np.median(times)), time_min = float(np.min(times)), peak_bytes = peak)
+
+
+def compare(result, base, time_threshold, mem_threshold, min_time):
+    if base is None:
+        return dict(status = "new")
+    time_ratio = result['time_median'] / base['time_median']
+    mem_ratio  = result['peak_bytes'] / max(base['peak_bytes'], 1)
+    # differences below min_time (seconds) are timer noise
+    slower     = result['time_median'] - base['time_median'] > max(time_threshold * base['time_median'], min_time)
+    regression = slower or mem_ratio > 1 + mem_threshold
+    return dict(status = "regression" if regression else "ok",
+                time_ratio = time_ratio, mem_ratio = mem_ratio)
+
+
+def run_benchmarks(repeat = 3, pattern = None, baseline = None, time_threshold = 0.2, mem_threshold = 0.1,
+                   min_time = 0.01):
+    cases   = simulate_cases()
+    results = list()
+    try:
+        cases += fit_cases()
+    except ImportError as err:
+        results.append(dict(id = "fit", status = "skipped", reason = f"{err}"))
+    for name, params, setup, run in cases:
+        cid = case_id(name, params)
+        if pattern is not None and pattern not in cid: continue
+        res = dict(id = cid, name = name, params = params, **measure(setup, run, repeat))
+        res.update(compare(res, None if baseline is None else baseline.get(cid, None), time_threshold, mem_threshold, min_time))
+        results.append(res)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Microbenchmarks of the simulate and fit functions.")
+    parser.add_argument("--repeat",         type = int,   default = 3)
+    parser.add_argument("--filter",         default = None, help = "run the cases whose id contains this string")
+    parser.add_argument("--baseline",       default = os.path.join(BASEDIR, "baseline.json"))
+    parser.add_argument("--save-baseline",  action = "store_true")
+    parser.add_argument("--report",         default = None, help = "JSON report of all cases")
+    parser.add_argument("--time-threshold", type = float, default = 0.2)
+    parser.add_argument("--mem-threshold",  type = float, default = 0.1)
+    parser.add_argument("--min-time",       type = float, default = 0.01)
+    opts     = parser.parse_args()
+
+    baseline = None
+    if not opts.save_baseline and os.path.isfile(opts.baseline):
+        with open(opts.baseline) as fh:
+            baseline = {x['id']: x for x in json.load(fh)['results'] if 'time_median' in x}
+    results  = run_benchmarks(repeat = opts.repeat, pattern = opts.filter, baseline = baseline,
+                              time_threshold = opts.time_threshold, mem_threshold = opts.mem_threshold,
+                              min_time = opts.min_time)
+    report   = dict(machine = dict(node = platform.node(), processor = platform.processor(),
+                                   python = platform.python_version(), numpy = np.__version__),
+                    time_threshold = opts.time_threshold, mem_threshold = opts.mem_threshold,
+                    min_time = opts.min_time, results = results)
+    for res in results:
+        if 'time_median' in res:
+            print(f"{res['status']:<10s} {res['id']:<60s} {res['time_median']:10.4f} s {res['peak_bytes'] / 1024**2:10.1f} MB")
+        else:
+            print(f"{res['status']:<10s} {res['id']:<60s} {res['reason']}")
+    if opts.save_baseline:
+        with open(opts.baseline, 'w') as fh:
+            json.dump(report, fh, indent = 2)
+    if opts.report is not None:
+        with open(opts.report, 'w') as fh:
+            json.dump(report, fh, indent = 2)
+    sys.exit(1 if any([x['status'] == "regression" for x in results]) else 0)
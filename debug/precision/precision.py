@@ -0,0 +1,112 @@
+#
+# Accuracy of the float32 precision mode against the float64 baseline.
+#
+# For each design, the same draws are simulated in float64 and in float32,
+# every method is fitted on both, and the table reports
+#   coef_relerr: || beta_32 - beta_64 || / || beta_64 ||
+#   mse64, mse32: test mean squared error of the predictions
+#   xbytes64, xbytes32: memory of the design
+# EBMR promotes the design to float64 (see fit_ebmr_base), its results only show the effect
+# of the rounded design.
+#
+# With --svd, the table reports instead the accuracy of the SVD of [1, X] used by EM-VAMP
+# (see fit.InterceptDesign) for the float64 and float32 designs, on the equicorrelated designs
+# and the changepoint designs of the fit_cpt grid (200 x 500, basis_k = 0, 1, 2):
+#   rank:     number of singular values kept
+#   recon:    max | U S V^T - [1, X] |
+#   orth:     max | U^T U - I |
+#
+# Usage (from this directory):
+#     python precision.py [--dims 500x200 500x10000] [--nrep 3]
+#     python precision.py --svd [--dims 500x200 500x2000] [--rho 0.95]
+#
+import numpy as np
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../dsc/functions"))
+import simulate
+import fit
+
+
+METHODS = {
+    'ridge_batch': lambda X, y: fit.fit_ridge_batch(X, y.reshape(-1, 1)),
+    'em_vamp':     lambda X, y: fit.fit_em_vamp(X, y),
+    'em_vamp_ash': lambda X, y: fit.fit_em_vamp(X, y, **fit.vamp_ash_grid(ncomp = 20)),
+    'ebmr_ash':    lambda X, y: fit.fit_ebmr_base(X, y, prior = 'mix_point'),
+}
+
+
+def predict(X, intercept, beta):
+    return simulate.design_dot(X, np.ravel(beta)) + intercept
+
+
+def benchmark(n, p, s = 10, pve = 0.5, rho = 0.5, nrep = 3, methods = None):
+    if methods is None: methods = list(METHODS.keys())
+    rows = list()
+    for rep in range(nrep):
+        data = dict()
+        for dtype in [np.float64, np.float32]:
+            rng = simulate.replicate_rngs(0, 1, start = rep)[0]
+            data[dtype] = simulate.equicorr_predictors(n, p, s, pve, rho = rho, rng = rng, dtype = dtype)
+        X64, y, Xtest64, ytest = data[np.float64][:4]
+        X32, Xtest32 = data[np.float32][0], data[np.float32][2]
+        for method in methods:
+            _, a64, b64 = METHODS[method](X64, y)
+            _, a32, b32 = METHODS[method](X32, y)
+            rows.append(dict(n = n, p = p, replicate = rep, method = method,
+                             coef_relerr = np.linalg.norm(np.ravel(b32) - np.ravel(b64)) / np.linalg.norm(b64),
+                             mse64 = np.mean((predict(Xtest64, a64, b64) - ytest)**2),
+                             mse32 = np.mean((predict(Xtest32, a32, b32) - ytest)**2),
+                             xbytes64 = X64.nbytes, xbytes32 = X32.nbytes))
+    return rows
+
+
+def svd_accuracy(designs, svd = 'lapack'):
+    rows = list()
+    for name, X64 in designs:
+        X64 = np.asarray(X64)
+        A   = np.concatenate((np.ones((X64.shape[0], 1)), X64), axis = 1)
+        for dtype in [np.float64, np.float32]:
+            U, s, Vt = fit.InterceptDesign(X64.astype(dtype), svd = svd).svd()
+            U, Vt    = U.astype(np.float64), Vt.astype(np.float64)
+            rows.append(dict(design = name, dtype = np.dtype(dtype).name, rank = s.shape[0],
+                             recon = np.max(np.abs(np.dot(U * s, Vt) - A)),
+                             orth  = np.max(np.abs(np.dot(U.T, U) - np.eye(U.shape[1])))))
+    return rows
+
+
+def svd_designs(dims, rho):
+    designs = list()
+    for n, p in dims:
+        rng = simulate.replicate_rngs(0, 1)[0]
+        designs.append((f"equicorr_{n}x{p}_rho{rho:g}", simulate.equicorr_predictors(n, p, 10, 0.5, rho = rho, rng = rng)[0]))
+    for k in [0, 1, 2]:
+        rng = simulate.replicate_rngs(0, 1)[0]
+        designs.append((f"changepoint_200x500_k{k}", simulate.changepoint_predictors(200, 500, 10, 20, k = k, rng = rng)[0]))
+    return designs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Accuracy of float32 against float64 fits.")
+    parser.add_argument("--dims",    nargs = '+', default = ["500x200", "500x10000"])
+    parser.add_argument("--nrep",    type = int, default = 3)
+    parser.add_argument("--methods", nargs = '+', choices = list(METHODS.keys()), default = None)
+    parser.add_argument("--svd",     action = 'store_true')
+    parser.add_argument("--svd-method", choices = ['lapack', 'gram'], default = 'lapack')
+    parser.add_argument("--rho",     type = float, default = 0.95)
+    opts = parser.parse_args()
+    if opts.svd:
+        cols = ['design', 'dtype', 'rank', 'recon', 'orth']
+        print("\t".join(cols))
+        dims = [[int(x) for x in d.split("x")] for d in opts.dims]
+        for row in svd_accuracy(svd_designs(dims, opts.rho), svd = opts.svd_method):
+            print("\t".join([f"{row[x]:.4g}" if isinstance(row[x], float) else f"{row[x]}" for x in cols]))
+        sys.exit(0)
+    cols = ['n', 'p', 'replicate', 'method', 'coef_relerr', 'mse64', 'mse32', 'xbytes64', 'xbytes32']
+    print("\t".join(cols))
+    for dims in opts.dims:
+        n, p = [int(x) for x in dims.split("x")]
+        for row in benchmark(n, p, nrep = opts.nrep, methods = opts.methods):
+            print("\t".join([f"{row[x]:.4g}" if isinstance(row[x], float) else f"{row[x]}" for x in cols]))
@@ -0,0 +1,87 @@
+#
+# Convergence control shared by the Python fit wrappers.
+#
+import numpy as np
+import time
+
+
+class ConvergenceMonitor:
+    '''
+    Tolerance-based early stopping.
+    At every iteration, update() receives any of the tracked quantities
+    (coefficients, objective, e.g. ELBO or log marginal likelihood, and residual variance)
+    and computes the largest relative change from the previous iteration.
+    The fit has converged when this change is below tol for patience consecutive iterations.
+    The fit is also stopped when max_iter iterations are done or the wall-clock time
+    exceeds max_time (seconds).
+    '''
+    def __init__(self, tol = 1e-6, patience = 3, max_iter = None, max_time = None):
+        self.tol         = tol
+        self.patience    = patience
+        self.max_iter    = max_iter
+        self.max_time    = max_time
+        self.n_iter      = 0
+        self.stop_reason = None
+        self.rel_change  = np.inf
+        self._nconv      = 0
+        self._prev       = None
+        self._start      = time.perf_counter()
+
+    def update(self, coef = None, objective = None, s2 = None):
+        '''
+        Returns True if the fit should stop.
+        '''
+        self.n_iter += 1
+        current = [np.ravel(x).astype(float) if x is not None else None for x in [coef, objective, s2]]
+        if self._prev is not None:
+            changes = [relative_change(x, x0) for x, x0 in zip(current, self._prev) if x is not None and x0 is not None]
+            self.rel_change = max(changes) if len(changes) > 0 else np.inf
+        self._prev = current
+        if self.tol is not None and self.rel_change < self.tol:
+            self._nconv += 1
+        else:
+            self._nconv  = 0
+        if self.tol is not None and self._nconv >= self.patience:
+            self.stop_reason = "converged"
+        elif self.max_iter is not None and self.n_iter >= self.max_iter:
+            self.stop_reason = "max_iter"
+        elif self.max_time is not None and self.elapsed() > self.max_time:
+            self.stop_reason = "max_time"
+        return self.stop_reason is not None
+
+    def finish(self, n_iter, path = None):
+        '''
+        For solvers which stop by their own criterion (e.g. EBMR, IRidge),
+        record the number of iterations, the last relative change of the objective path
+        and the reason to stop: "converged" only if the last relative change is below tol,
+        "max_iter" if all iterations were done, otherwise "stopped" (by the criterion of the solver).
+        '''
+        self.n_iter      = n_iter
+        if path is not None and len(path) > 1:
+            self.rel_change = relative_change(np.ravel(path[-1]).astype(float), np.ravel(path[-2]).astype(float))
+        if self.tol is not None and self.rel_change < self.tol:
+            self.stop_reason = "converged"
+        elif self.max_iter is not None and n_iter >= self.max_iter:
+            self.stop_reason = "max_iter"
+        else:
+            self.stop_reason = "stopped"
+        return self.summary()
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def summary(self):
+        return dict(n_iter = self.n_iter, stop_reason = self.stop_reason,
+                    rel_change = self.rel_change, time = self.elapsed())
+
+
+def relative_change(x, x0):
+    return np.linalg.norm(x - x0) / max(np.linalg.norm(x0), np.finfo(float).eps)
+
+
+def check_tol_only(method, patience, max_time):
+    '''
+    For solvers which stop by their own criterion, with tol only.
+    '''
+    if patience != 1 or max_time is not None:
+        raise ValueError(f"{method} stops by its own criterion with tol; patience and max_time are not supported")
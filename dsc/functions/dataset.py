@@ -0,0 +1,76 @@
+#
+# Memory-mapped dataset shared by the simulate, fit and predict modules.
+#
+# Each array is stored as a raw column-major (Fortran order) binary file,
+# which is also the native layout of R matrices.
+# A small text manifest lists one array per line:
+#     <name> <dtype> <shape> <binary file>
+# where shape is a comma-separated list of dimensions
+# and the binary file is relative to the directory of the manifest,
+# or an absolute path for the arrays shared with another dataset (see write_dataset).
+#
+import numpy as np
+import os
+
+
+def write_dataset(path, shared = None, **arrays):
+    '''
+    Write the arrays to binary files next to the manifest (path).
+    Arrays which are the same object (e.g. X and Xtest for changepoint)
+    are written only once and share the binary file.
+    shared is the manifest of another dataset (e.g. a cached design),
+    whose arrays are listed in this manifest by the absolute path of their binary files
+    instead of being copied; that dataset must be kept as long as this one is read.
+    '''
+    outdir   = os.path.dirname(os.path.abspath(path))
+    prefix   = os.path.splitext(os.path.basename(path))[0]
+    written  = dict()
+    lines    = list()
+    if shared is not None:
+        shared_dir = os.path.dirname(os.path.abspath(shared))
+        for name, (dtype, shape, binfile) in read_manifest(shared).items():
+            shape = ",".join([f"{d}" for d in shape])
+            lines.append(f"{name} {dtype.name} {shape} {os.path.join(shared_dir, binfile)}\n")
+    for name, xin in arrays.items():
+        x = np.asarray(xin)
+        if id(xin) not in written:
+            binfile = f"{prefix}.{name}.bin"
+            xmap    = np.memmap(os.path.join(outdir, binfile), dtype = x.dtype, mode = 'w+',
+                                shape = x.shape, order = 'F')
+            xmap[:] = x
+            xmap.flush()
+            del xmap
+            written[id(xin)] = binfile
+        shape = ",".join([f"{d}" for d in x.shape])
+        lines.append(f"{name} {x.dtype.name} {shape} {written[id(xin)]}\n")
+    with open(path, 'w') as mfile:
+        mfile.writelines(lines)
+    return
+
+
+def read_manifest(path):
+    manifest = dict()
+    with open(path, 'r') as mfile:
+        for line in mfile:
+            if line.strip() == "" or line.startswith("#"): continue
+            name, dtype, shape, binfile = line.split()
+            shape = tuple([int(d) for d in shape.split(",")])
+            manifest[name] = (np.dtype(dtype), shape, binfile)
+    return manifest
+
+
+def read_dataset(path, names = None, mode = 'r'):
+    '''
+    Returns a dict of read-only memory maps of the arrays listed in the manifest (path).
+    If names is given, only those arrays are mapped.
+    '''
+    indir    = os.path.dirname(os.path.abspath(path))
+    manifest = read_manifest(path)
+    if names is None:
+        names = list(manifest.keys())
+    data = dict()
+    for name in names:
+        dtype, shape, binfile = manifest[name]
+        data[name] = np.memmap(os.path.join(indir, binfile), dtype = dtype, mode = mode,
+                               shape = shape, order = 'F')
+    return data
@@ -0,0 +1,104 @@
+#
+# Persistent cache of the factorizations of the design matrices.
+#
+# The fit modules run on the same simulated design one after another,
+# and each of them would otherwise factorize it again.
+# The factors are stored as .npy files in one directory per design,
+# keyed by a content hash of the matrix, and mapped read-only on a hit.
+# The cache is bounded in size; the least recently used designs are evicted first.
+#
+# The cache is enabled by setting the environment variable
+#     EBLINREG_FACTOR_CACHE=<directory>
+# and its size (in bytes, default 4 GB) with
+#     EBLINREG_FACTOR_CACHE_SIZE=<bytes>
+#
+import numpy as np
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+def design_hash(X, tag = None, chunk = 1024):
+    '''
+    Content hash of X, independent of its memory layout.
+    The rows are hashed in chunks to avoid a full copy of F-ordered / memory-mapped arrays.
+    tag distinguishes factorizations of derived matrices (e.g. "intercept").
+    '''
+    h = hashlib.blake2b(digest_size = 20)
+    h.update(f"{X.shape} {X.dtype.name} {tag}".encode())
+    for i in range(0, X.shape[0], chunk):
+        h.update(np.ascontiguousarray(X[i:i + chunk]).data)
+    return h.hexdigest()
+
+
+def cache_dir_from_env():
+    return os.environ.get("EBLINREG_FACTOR_CACHE", None)
+
+
+def cache_size_from_env():
+    return int(os.environ.get("EBLINREG_FACTOR_CACHE_SIZE", 4 * 1024**3))
+
+
+def cached_factors(key, compute, names, cache_dir = None, max_bytes = None):
+    '''
+    Returns the tuple of arrays (names) obtained from compute(),
+    which is called only if they are not in the cache.
+    If cache_dir is None, the cache directory is obtained from the environment;
+    without a cache directory, the factors are computed without caching.
+    '''
+    if cache_dir is None: cache_dir = cache_dir_from_env()
+    if max_bytes is None: max_bytes = cache_size_from_env()
+    if cache_dir is None:
+        return compute()
+    entry = os.path.join(cache_dir, f"{key}.{'_'.join(names)}")
+    if os.path.isdir(entry):
+        try:
+            factors = [np.load(os.path.join(entry, f"{x}.npy"), mmap_mode = 'r') for x in names]
+            os.utime(entry)
+            return tuple(factors)
+        except (OSError, ValueError):
+            # evicted or being replaced by a concurrent instance
+            pass
+    factors = compute()
+    _store(cache_dir, entry, dict(zip(names, factors)), max_bytes)
+    return factors
+
+
+def _store(cache_dir, entry, arrays, max_bytes):
+    '''
+    Write the arrays in a private directory and move it in place,
+    so that concurrent instances never read a partially written entry.
+    '''
+    os.makedirs(cache_dir, exist_ok = True)
+    tmpdir = tempfile.mkdtemp(dir = cache_dir, prefix = ".tmp")
+    for name, x in arrays.items():
+        np.save(os.path.join(tmpdir, f"{name}.npy"), x)
+    try:
+        os.rename(tmpdir, entry)
+    except OSError:
+        # another instance has stored the same factors
+        shutil.rmtree(tmpdir, ignore_errors = True)
+    _evict(cache_dir, max_bytes)
+    return
+
+
+def _evict(cache_dir, max_bytes):
+    '''
+    Remove the least recently used entries until the cache fits in max_bytes.
+    '''
+    entries = list()
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(".tmp") or not os.path.isdir(path): continue
+        try:
+            size = sum([os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)])
+            entries.append((os.path.getmtime(path), size, path))
+        except OSError:
+            continue
+    total = sum([x[1] for x in entries])
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes: break
+        shutil.rmtree(path, ignore_errors = True)
+        total -= size
+    return
@@ -1,66 +1,247 @@
 #
 import numpy as np
 import vampyre
+from vampyre.trans.base import BaseLinTrans
 from ebmrPy.inference.ebmr import EBMR
 from ebmrPy.inference.iridge import IRidge
 import collections
+from scipy.sparse.linalg import LinearOperator
 
+from factorization import cached_factors, cache_dir_from_env, design_hash
+from history import compact_history
+from convergence import ConvergenceMonitor, check_tol_only
+from threads import thread_budget
+from modelstore import slim_model
+from profiling import Profiler
+import warmstart
+
+
+# Convergence control (see convergence.ConvergenceMonitor), common to all wrappers:
+#   tol:      relative tolerance for early stopping; None runs the full max_iter iterations
+#   patience: number of consecutive iterations below tol
+#   max_time: wall-clock budget of the fit (seconds)
+# EBMR and IRidge stop by their own criterion on the objective, 
+# which is used with tol; they raise ValueError for patience != 1 or a max_time.
+# The number of iterations and the reason to stop are reported in the model.
+#
+# Warm start (opt-in, see warmstart.py), common to all wrappers:
+#   warm_start: directory of the warm-start store; None starts from scratch
+#   setting:    numeric label of the simulation setting, e.g. (s, se)
+# The fit is initialized with the converged hyperparameters of the nearest setting
+# solved earlier on the same design, which is reported as model['warm_start'].
+#
+# The number of BLAS threads of every fit is sized from (n, p, method)
+# within the core budget of the instance (see threads.py).
+#
+# profile: records of the setup, factorization, solver iterations and output
+# of the fit, and the peak memory, in model['profile'] (off by default, see profiling.py).
 
 def fit_ebmr_base(X, y, prior = 'point', grr = 'mle', 
              grid = np.array([0.001, 1.0, 2.0, 3.0, 4.0]), 
-             ignore_convergence = True):
-    # EBMR does not add intercept
-    # Hence, adding an extra column of 1 to X
-    Xc, yc, y0 = add_intercept_column(X, y)
-    ebmr       = EBMR(Xc, yc, prior = prior, grr = grr,
-                      sigma = 'full', inverse = 'direct',
-                      s2_init = 1.0, sb2_init = 1.0,
-                      max_iter = 100, tol = 1e-8,
-                      mll_calc = False,
-                      mix_point_w = grid,
-                      ignore_convergence = True
-                     )
-    ebmr.update()
+             ignore_convergence = True, max_iter = 100,
+             tol = None, patience = 1, max_time = None,
+             warm_start = None, setting = None,
+             sigma = 'full', inverse = None,
+             heavy = 'diag', heavy_file = None,
+             profile = None):
+    '''
+    sigma:   'full' or 'diagonal' posterior covariance of the coefficients
+    inverse: 'direct' inverts the (p + 1) x (p + 1) system,
+             'woodbury' solves the dual n x n system instead;
+             None chooses 'woodbury' if p + 1 > n.
+    The choice is reported as model['solver'].
+    heavy:   storage of the (p + 1) x (p + 1) matrices sigma, Wbar and Wbarinv
+             in the model (see modelstore.py): 'none', 'diag' or 'full' (in heavy_file).
+    '''
+    check_tol_only("EBMR", patience, max_time)
+    monitor    = ConvergenceMonitor(tol = tol, max_iter = max_iter)
+    profiler   = Profiler(profile)
+    method     = f"ebmr_{prior}"
+    with profiler.phase('setup'):
+        key, prev  = warm_start_lookup(warm_start, X, method, setting)
+        init       = dict(s2_init = 1.0, sb2_init = 1.0)
+        if prev is not None:
+            init   = dict(s2_init = float(prev['s2']), sb2_init = float(prev['sb2']))
+        # EBMR does not add intercept
+        # Hence, adding an extra column of 1 to X
+        # (in float64, also for a single precision X: ebmrPy solves in float64,
+        # hence the float32 mode does not apply to EBMR)
+        Xc, yc, y0 = add_intercept_column(X, y)
+        if inverse is None:
+            inverse = 'woodbury' if Xc.shape[1] > Xc.shape[0] else 'direct'
+        ebmr       = EBMR(Xc, yc, prior = prior, grr = grr,
+                          sigma = sigma, inverse = inverse,
+                          **init,
+                          max_iter = max_iter, tol = 1e-8 if tol is None else tol,
+                          mll_calc = False,
+                          mix_point_w = grid,
+                          ignore_convergence = ignore_convergence if tol is None else False
+                         )
+    with profiler.phase('solve'), thread_budget(X.shape, f"ebmr_{inverse}"):
+        ebmr.update()
     intercept  = ebmr.mu[0] + y0
     beta       = ebmr.mu[1:]
-    # Convert the Python class to dictionary
-    model = class_to_dict(ebmr, 
-        ['s2', 'sb2', 'sigma', 'mu', 'Wbar', 'Wbarinv', 
-         'elbo', 'mll_path', 'elbo_path', 'n_iter', 'mixcoef'])
+    with profiler.phase('output'):
+        # Convert the Python class to dictionary
+        model = class_to_dict(ebmr, 
+            ['s2', 'sb2', 'sigma', 'mu', 'Wbar', 'Wbarinv', 
+             'elbo', 'mll_path', 'elbo_path', 'n_iter', 'mixcoef'])
+        model['convergence'] = monitor.finish(ebmr.n_iter, path = ebmr.elbo_path)
+        model['solver']      = dict(sigma = sigma, inverse = inverse)
+        model = slim_model(model, ['sigma', 'Wbar', 'Wbarinv'], mode = heavy, path = heavy_file)
+        model['warm_start']  = warm_start_save(warm_start, key, method, setting, prev,
+                                               s2 = ebmr.s2, sb2 = ebmr.sb2, beta = ebmr.mu)
+    if profiler.enabled:
+        model['profile'] = profiler.summary(n_iter = ebmr.n_iter)
     return model, intercept, beta
 
 
-def fit_iridge(X, y, max_iter = 1000):
-    Xc, yc, y0 = add_intercept_column(X, y)
-    iridge     = IRidge(Xc, yc, max_iter = max_iter)
-    iridge.update()
+def fit_iridge(X, y, max_iter = 1000,
+               tol = None, patience = 1, max_time = None,
+               warm_start = None, setting = None, profile = None):
+    check_tol_only("IRidge", patience, max_time)
+    monitor    = ConvergenceMonitor(tol = tol, max_iter = max_iter)
+    profiler   = Profiler(profile)
+    method     = "iridge"
+    with profiler.phase('setup'):
+        key, prev  = warm_start_lookup(warm_start, X, method, setting)
+        init       = dict()
+        if tol is not None:
+            init['tol'] = tol
+        if prev is not None:
+            init.update({f"{x}_init": float(prev[x]) for x in ['s2', 'sb2', 'sw2']})
+        Xc, yc, y0 = add_intercept_column(X, y)
+        iridge     = IRidge(Xc, yc, max_iter = max_iter, **init)
+    with profiler.phase('solve'), thread_budget(X.shape, 'iridge'):
+        iridge.update()
     intercept  = iridge.beta[0] + y0
     beta       = iridge.beta[1:]
-    # Convert the Python class to dictionary
-    model  = class_to_dict(iridge, 
-        ['s2', 'sb2', 'sw2', 'beta', 'mll_path', 'n_iter'])
+    with profiler.phase('output'):
+        # Convert the Python class to dictionary
+        model  = class_to_dict(iridge, 
+            ['s2', 'sb2', 'sw2', 'beta', 'mll_path', 'n_iter'])
+        model['convergence'] = monitor.finish(iridge.n_iter, path = iridge.mll_path)
+        model['warm_start']  = warm_start_save(warm_start, key, method, setting, prev,
+                                               s2 = iridge.s2, sb2 = iridge.sb2, sw2 = iridge.sw2, beta = iridge.beta)
+    if profiler.enabled:
+        model['profile'] = profiler.summary(n_iter = iridge.n_iter)
+    return model, intercept, beta
+
+
+# Batched fits of m responses (columns of the n x m matrix Y) on the same design,
+# e.g. replicates with a common design or different pve levels.
+# The intercepts (m,) and the coefficients (p x m) are returned stacked.
+# Only the ridge model has a factorization shared by all responses:
+# the other EBMR priors and IRidge update a different W for every response.
+
+def fit_ebmr_batch(X, Y, prior = 'point', max_iter = 100, tol = None, profile = None):
+    '''
+    EBMR with prior = 'point' keeps W = I, hence it is empirical Bayes ridge regression,
+    and with grr = 'mle' its (s2, sb2) converge to the maximum of the marginal likelihood,
+    which is the fixed point of fit_ridge_batch (see debug/batch/ebmr_point.py).
+    '''
+    if prior != 'point':
+        raise ValueError(f"Batched EBMR is only available for prior = 'point', not {prior}")
+    return fit_ridge_batch(X, Y, max_iter = max_iter, tol = tol, profile = profile)
+
+
+def fit_ridge_batch(X, Y, max_iter = 100, tol = None, s2_init = 1.0, sb2_init = 1.0, profile = None):
+    '''
+    Empirical Bayes ridge regression of every column of Y on [1, X],
+        y = [1, X] b + e,  b ~ N(0, s2 sb2 I),  e ~ N(0, s2 I),
+    with the EM updates of (s2, sb2) in the basis of the thin SVD [1, X] = U S V^T.
+    After the projection Z = U^T Y (one BLAS-3 product), every iteration costs O(r m)
+    for rank r, instead of a factorization of the (p + 1) x (p + 1) system for every response.
+    '''
+    monitor     = ConvergenceMonitor(tol = tol, patience = 1, max_iter = max_iter)
+    profiler    = Profiler(profile)
+    with profiler.phase('setup'):
+        Xc, Yc, y0  = add_intercept_operator(X, Y)
+    n, p1       = Xc.shape
+    m           = Yc.shape[1]
+    with profiler.phase('factorization'), thread_budget(X.shape, 'ridge'):
+        U, s, Vt    = Xc.svd()
+        Z           = np.dot(U.T, Yc)
+    d           = s**2
+    # squared norm of the residual outside the column space of [1, X]
+    rperp       = np.maximum(np.einsum('ij,ij->j', Yc, Yc) - np.einsum('ij,ij->j', Z, Z), 0)
+    s2          = np.repeat(float(s2_init), m)
+    sb2         = np.repeat(float(sb2_init), m)
+    with profiler.phase('solve'):
+        for it in range(max_iter):
+            # posterior mean in the SVD basis, g_j = s_j / (d_j + 1 / sb2), and shrinkage
+            D       = d.reshape(-1, 1) + 1 / sb2
+            G       = Z * s.reshape(-1, 1) / D
+            shrink  = Z / D / sb2
+            # expected squared norms of the residual and the coefficients
+            err2    = rperp + np.sum(shrink**2, axis = 0) + s2 * np.sum(d.reshape(-1, 1) / D, axis = 0)
+            b2      = np.sum(G**2, axis = 0) + s2 * (np.sum(1 / D, axis = 0) + (p1 - s.shape[0]) * sb2)
+            s2      = (err2 + b2 / sb2) / (n + p1)
+            sb2     = b2 / (p1 * s2)
+            profiler.iteration()
+            if monitor.update(objective = sb2, s2 = s2):
+                break
+    D           = d.reshape(-1, 1) + 1 / sb2
+    B           = np.dot(Vt.T, Z * s.reshape(-1, 1) / D)
+    intercept   = B[0] + y0
+    beta        = B[1:]
+    model       = dict(s2 = s2, sb2 = sb2, mu = B, n_iter = monitor.n_iter,
+                       convergence = monitor.summary())
+    if profiler.enabled:
+        model['profile'] = profiler.summary()
     return model, intercept, beta
 
 
 def fit_em_vamp(X, y, max_iter = 100,
             probc = None, meanc = None, varc = None,
-            mean_fix = None, var_fix = None):
+            mean_fix = None, var_fix = None,
+            history = None, history_step = 10, history_size = 20,
+            history_float32 = False, history_file = None,
+            tol = None, patience = 3, max_time = None,
+            warm_start = None, setting = None, profile = None,
+            svd = 'lapack'):
+    '''
+    Returns the history of the estimates (zhat) as the model.
+    By default (history = None), this is the list of all iterates.
+    Otherwise, a compact history is returned (see history.compact_history),
+    with the checkpoints chosen by the policy history = 'all' / 'every' / 'log',
+    optionally delta-encoded in float32 and saved to history_file
+    (which holds an empty array if the history is not compact).
+    With early stopping (tol or max_time), a warm-start store or profiling, the history is always compact
+    and includes the convergence summary, the warm-start setting and the profiling records.
+    svd: method of the SVD of [1, X], 'lapack' or 'gram' (see InterceptDesign.svd).
+    '''
+    monitor     = ConvergenceMonitor(tol = tol, patience = patience, max_iter = max_iter, max_time = max_time)
+    profiler    = Profiler(profile)
+    ncomp       = next((len(x) for x in [probc, meanc, varc] if x is not None), 2)
+    method      = f"em_vamp_{ncomp}"
 
-    n, p        = X.shape
-    # For intercept, add a column of 1s to X
-    # redundant because I am also subtracting the mean of y
-    Xc, yc, y0  = add_intercept_column(X, y)
+    with profiler.phase('setup'):
+        key, prev   = warm_start_lookup(warm_start, X, method, setting)
+
+        n, p        = X.shape
+        # For intercept, use [1, X] as a lazy operator (no copy of X, except for its SVD)
+        # redundant because I am also subtracting the mean of y
+        Xc, yc, y0  = add_intercept_operator(X, y, svd = svd)
+
+        # Initial sigma2 is set to the variance of y (mean centered).
+        sigma2_init = np.mean(yc**2)
 
-    # Initial sigma2 is set to the variance of y (mean centered).
-    sigma2_init = np.mean(yc**2)
+        # Initial probc, meanc, varc
+        probc, meanc, varc = vamp_initialize(Xc, probc, meanc, varc, sigma2_init)
 
-    # Initial probc, meanc, varc
-    probc, meanc, varc = vamp_initialize(Xc, probc, meanc, varc, sigma2_init)
+        # or the converged values of the nearest setting, if available
+        if prev is not None and all([x in prev for x in ['wvar', 'probc', 'meanc', 'varc']]):
+            sigma2_init        = float(np.mean(prev['wvar']))
+            probc, meanc, varc = [np.ravel(prev[x]) for x in ['probc', 'meanc', 'varc']]
 
     # Get the estimation history
     # has_converged = True
-    solver = vamp_solver(Xc, yc.reshape(-1, 1), probc, meanc, varc, sigma2_init, max_iter, 
-                         mean_fix = mean_fix, var_fix = var_fix)
+    with thread_budget(X.shape, 'em_vamp'):
+        solver = vamp_solver(Xc, yc.reshape(-1, 1), probc, meanc, varc, sigma2_init, max_iter, 
+                             mean_fix = mean_fix, var_fix = var_fix,
+                             monitor = monitor,
+                             profiler = profiler)
     bhat_hist = solver.hist_dict['zhat']
 
     ## # Tune off the wvar if estimation has not converged
@@ -83,14 +264,39 @@ def fit_em_vamp(X, y, max_iter = 100,
     for bhat in bhat_hist:
         bhat[0] += y0
     bopt = bhat_hist[-1].reshape(-1)
+    compact = tol is not None or max_time is not None or warm_start is not None or profiler.enabled
+    if history is None and compact:
+        history = 'all'
+    with profiler.phase('output'):
+        if history is not None:
+            bhat_hist = compact_history(bhat_hist, policy = history, step = history_step, size = history_size,
+                                        float32 = history_float32, path = history_file)
+        elif history_file is not None:
+            # history_file is a declared output of the DSC modules, hence it is always written
+            np.save(history_file, np.empty((0, p + 1)))
+        if isinstance(bhat_hist, dict):
+            bhat_hist['convergence'] = monitor.summary()
+        wsinfo = warm_start_save(warm_start, key, method, setting, prev,
+                                 probc = getattr(solver.gmm_est, 'probc', None),
+                                 meanc = getattr(solver.gmm_est, 'meanc', None),
+                                 varc  = getattr(solver.gmm_est, 'varc',  None),
+                                 wvar  = getattr(solver.lin_est, 'wvar',  None),
+                                 beta  = bopt)
+    if isinstance(bhat_hist, dict):
+        bhat_hist['warm_start'] = wsinfo
+    if profiler.enabled:
+        bhat_hist['profile'] = profiler.summary()
     return bhat_hist, bopt[0], bopt[1:]
 
 
 def vamp_solver(X, y, probc, meanc, varc, sigma2_init, max_iter, 
-                tune_wvar = True, tune_gmm = True, mean_fix = None, var_fix = None):
+                tune_wvar = True, tune_gmm = True, mean_fix = None, var_fix = None,
+                monitor = None, profiler = None):
+    if profiler is None: profiler = Profiler(False)
     n, p        = X.shape
     bshape      = (p, 1)
-    Xop         = vampyre.trans.MatrixLT(X, bshape)
+    with profiler.phase('factorization'):
+        Xop     = vamp_transform(X, bshape)
     # flag indicating if the estimator uses MAP estimation (else use MMSE).
     map_est     = False
     # Use Gaussian mixture estimator class with auto-tuning
@@ -108,13 +314,127 @@ def vamp_solver(X, y, probc, meanc, varc, sigma2_init, max_iter,
     # Create the message handler
     msg_hdl     = vampyre.estim.MsgHdlSimp(map_est = map_est, shape = bshape)
     # Create the solver
-    solver      = vampyre.solver.Vamp(est_in_em, est_out_em, msg_hdl, hist_list=['zhat'],
-                                      nit = max_iter, prt_period = 0)
+    solver      = MonitoredVamp(est_in_em, est_out_em, msg_hdl, hist_list=['zhat'],
+                                nit = max_iter, prt_period = 0, monitor = monitor, profiler = profiler)
+    # Keep the estimators, for their converged parameters
+    solver.gmm_est = est_in_em
+    solver.lin_est = est_out_em
     # Run the solver
-    solver.solve()
+    with profiler.phase('solve'):
+        try:
+            solver.solve()
+        except StopSolver:
+            pass
     return solver
 
 
+class StopSolver(Exception):
+    pass
+
+
+class MonitoredVamp(vampyre.solver.Vamp):
+    '''
+    vampyre.solver.Vamp which checks the convergence monitor
+    whenever the history of an iteration is saved,
+    and stops the solver (by raising StopSolver) as requested by the monitor.
+    The end of the iteration is also marked in the profiler.
+    '''
+    def __init__(self, *args, monitor = None, profiler = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.monitor  = monitor
+        self.profiler = profiler
+
+    def save_hist(self):
+        super().save_hist()
+        if self.profiler is not None:
+            self.profiler.iteration()
+        if self.monitor is not None and self.monitor.update(coef = self.zhat):
+            raise StopSolver
+
+
+def vamp_transform(X, bshape):
+    # The SVD of [1, X] is computed once per design, with the factorization cache.
+    if isinstance(X, InterceptDesign):
+        U, s, Vt = X.svd()
+        return SVDMatrixLT(X, bshape, U, s, Vt)
+    return vampyre.trans.MatrixLT(X, bshape)
+
+
+class SVDMatrixLT(BaseLinTrans):
+    '''
+    Equivalent of vampyre.trans.MatrixLT(A, shape0),
+    which uses a precomputed thin SVD, A = U diag(s) Vt, 
+    instead of computing it.
+    Single precision factors are applied to rounded operands
+    and the results are returned in float64, as used by the estimators.
+    '''
+    def __init__(self, A, shape0, U, s, Vt, name = None):
+        shape1 = (A.shape[0],) + tuple(shape0[1:])
+        BaseLinTrans.__init__(self, shape0, shape1, svd_avail = True, name = name)
+        self.A  = A
+        self.U  = U
+        self.s  = s
+        self.Vt = Vt
+        # s is repeated over all but the first axis
+        self.sshape    = (s.shape[0],) + tuple(shape0[1:])
+        self.srep_axes = tuple(range(1, len(shape0)))
+
+    def dot(self, z0):
+        return self.A.dot(z0)
+
+    def dotH(self, z1):
+        return self.A.T.dot(z1)
+
+    def Usvd(self, q1):
+        return self._dot(self.U, q1)
+
+    def UsvdH(self, z1):
+        return self._dot(self.U.T, z1)
+
+    def Vsvd(self, q0):
+        return self._dot(self.Vt.T, q0)
+
+    def VsvdH(self, z0):
+        return self._dot(self.Vt, z0)
+
+    def _dot(self, F, x):
+        return F.dot(x.astype(F.dtype, copy = False)).astype(np.float64, copy = False)
+
+    def get_svd_diag(self):
+        return self.s, self.sshape, self.srep_axes
+
+
+def warm_start_lookup(warm_start, X, method, setting):
+    if warm_start is None:
+        return None, None
+    key  = design_hash(X)
+    return key, warmstart.lookup(warm_start, key, method, setting)
+
+
+def warm_start_save(warm_start, key, method, setting, prev, **params):
+    '''
+    Save the converged parameters and return the setting used for initialization.
+    '''
+    if warm_start is None:
+        return None
+    warmstart.save(warm_start, key, method, setting, **params)
+    return None if prev is None else prev['setting']
+
+
+def vamp_ash_grid(ncomp = 20):
+    '''
+    Initial GMM of EM-VAMP with the adaptive shrinkage (ash) prior:
+    zero-mean components on a fixed grid of variances, with fixed means and variances.
+    '''
+    probc    = None
+    meanc    = np.zeros(ncomp)
+    varc     = (4**(np.arange(ncomp)/ncomp) - 1)**2
+    varc[0]  = 1e-4
+    mean_fix = np.ones(ncomp)
+    var_fix  = np.ones(ncomp)
+    return dict(probc = probc, meanc = meanc, varc = varc, mean_fix = mean_fix, var_fix = var_fix)
+
+
 # Some ad-hoc initialization of the Gaussian Mixture Model (GMM)
 def vamp_initialize(X, probc, meanc, varc, sigma2_init):
     n, p         = X.shape
@@ -136,7 +456,7 @@ def vamp_initialize(X, probc, meanc, varc, sigma2_init):
         meanc     = np.zeros(ncomp)
     # Variance of each component
     if varc is None:
-        var_hi    = sigma2_init / (np.mean(np.abs(X)**2) * p * np.sum(probc[1:]))
+        var_hi    = sigma2_init / (mean_square(X) * p * np.sum(probc[1:]))
         var_hi    = max(var_hi, 0.1)
         varc      = var_hi * np.arange(ncomp) / (ncomp - 1)
         varc[0]   = var_hi * 1e-4 # the first component cannot be zero.
@@ -162,3 +482,116 @@ def add_intercept_column(X, y):
     Xnew  = np.concatenate((np.ones((n, 1)),  X), axis = 1)
     ynew  = y - ymean
     return Xnew, ynew, ymean
+
+
+def add_intercept_operator(X, y, svd = 'lapack'):
+    ymean = np.mean(y, axis = 0)
+    ynew  = y - ymean
+    return InterceptDesign(X, svd = svd), ynew, ymean
+
+
+def mean_square(X):
+    if isinstance(X, InterceptDesign):
+        return X.mean_square()
+    return np.mean(np.abs(X)**2, dtype = np.float64)
+
+
+class InterceptDesign(LinearOperator):
+    '''
+    Lazy n x (p + 1) design [1, X], for the intercept without a copy of X.
+    The first coefficient is the intercept.
+    svd: method of the thin SVD of [1, X] (see svd()), 'lapack' or 'gram'.
+    '''
+    # largest deviation of U^T U from the identity accepted for the 'gram' factors
+    GRAM_TOL = 1e-10
+
+    def __init__(self, X, svd = 'lapack'):
+        n, p = X.shape
+        super().__init__(dtype = X.dtype, shape = (n, p + 1))
+        self.X = X
+        if svd not in ['lapack', 'gram']:
+            raise ValueError(f"Unknown SVD method: {svd}")
+        self.svd_method = svd
+
+    def _matvec(self, b):
+        return self._matmat(b.reshape(-1, 1))
+
+    def _rmatvec(self, r):
+        return self._rmatmat(r.reshape(-1, 1))
+
+    # For a single precision X, the (small) operand is rounded instead of promoting X,
+    # and the result is accumulated in float64.
+    def _matmat(self, B):
+        return np.dot(self.X, B[1:].astype(self.X.dtype, copy = False)) + B[:1]
+
+    def _rmatmat(self, R):
+        XtR = np.dot(self.X.T, R.astype(self.X.dtype, copy = False)).astype(np.float64, copy = False)
+        return np.concatenate((np.sum(R, axis = 0, keepdims = True), XtR), axis = 0)
+
+    def mean_square(self):
+        n, p = self.X.shape
+        return (n + np.einsum('ij,ij->', self.X, self.X, dtype = np.float64)) / (n * (p + 1))
+
+    def dense(self):
+        '''
+        [1, X] in float64.
+        '''
+        n, p = self.X.shape
+        A    = np.empty((n, p + 1))
+        A[:, 0]  = 1.0
+        A[:, 1:] = self.X
+        return A
+
+    def svd(self):
+        '''
+        Thin SVD of [1, X] without truncation, also stored in the factorization cache, if it is enabled.
+        'lapack' (default): LAPACK SVD of the dense [1, X].
+        'gram' (opt-in, for well-conditioned wide designs): eigendecomposition of the smaller Gram matrix,
+            which squares the condition number; the factors are used only if they are of full rank
+            and U^T U is the identity within GRAM_TOL, otherwise the LAPACK SVD is computed.
+        The factorization is done in float64;
+        for a single precision X, the singular vectors are stored in single precision.
+        '''
+        key = design_hash(self.X, tag = f"intercept_{self.svd_method}") if cache_dir_from_env() is not None else None
+        return cached_factors(key, self._svd, ['U', 's', 'Vt'])
+
+    def _svd(self):
+        factors = self._gram_svd() if self.svd_method == 'gram' else None
+        if factors is None:
+            factors = np.linalg.svd(self.dense(), full_matrices = False)
+        U, s, Vt = factors
+        return U.astype(self.X.dtype, copy = False), s, Vt.astype(self.X.dtype, copy = False)
+
+    def _gram_svd(self):
+        X    = self.X.astype(np.float64, copy = False)
+        n, p = X.shape
+        if n <= p + 1:
+            # [1, X] [1, X]^T = X X^T + 1 1^T = U S^2 U^T
+            K      = np.dot(X, X.T) + 1.0
+        else:
+            # [1, X]^T [1, X] = V S^2 V^T
+            xsum   = np.sum(X, axis = 0)
+            K      = np.empty((p + 1, p + 1))
+            K[0, 0]   = n
+            K[0, 1:]  = xsum
+            K[1:, 0]  = xsum
+            K[1:, 1:] = np.dot(X.T, X)
+        # eigenvalues in decreasing order, as returned by np.linalg.svd
+        w, Q   = np.linalg.eigh(K)
+        w, Q   = w[::-1], Q[:, ::-1]
+        if w[-1] <= w[0] * max(K.shape) * np.finfo(np.float64).eps:
+            # rank deficient
+            return None
+        s      = np.sqrt(w)
+        if n <= p + 1:
+            U  = Q
+            Vt = np.concatenate((np.sum(U, axis = 0, keepdims = True), np.dot(X.T, U)), axis = 0).T / s.reshape(-1, 1)
+            W  = Vt
+        else:
+            U  = (np.dot(X, Q[1:]) + Q[:1]) / s
+            Vt = Q.T
+            W  = U.T
+        # the factor derived from Q carries the error of the Gram matrix
+        if np.max(np.abs(np.dot(W, W.T) - np.eye(W.shape[0]))) > self.GRAM_TOL:
+            return None
+        return U, s, Vt
@@ -0,0 +1,83 @@
+#
+# Compact storage of the iterates of the fit methods (e.g. zhat of EM-VAMP).
+#
+# Instead of a list of (p+1)-vectors for every iteration,
+# the history is a dict with
+#     iter:     iterations of the checkpoints (0-based)
+#     encoding: "float64" or "float32-delta"
+#     zhat:     T x (p + 1) array of the checkpoints, or
+#     file:     name of a .npy file with this array (read with memory mapping)
+# For "float32-delta", row t stores the difference from the decoded row t - 1 in float32,
+# and the checkpoints are recovered by a cumulative sum in float64.
+#
+import numpy as np
+import os
+
+
+def checkpoints(niter, policy = 'all', step = 10, size = 20):
+    '''
+    Iterations to keep from a history of length niter.
+        all:   every iteration
+        every: every step-th iteration
+        log:   about size iterations, spaced logarithmically
+    The last iteration is always kept.
+    '''
+    if policy == 'all':
+        index = np.arange(niter)
+    elif policy == 'every':
+        index = np.arange(0, niter, step)
+    elif policy == 'log':
+        index = np.unique(np.geomspace(1, niter, num = size).astype(int) - 1)
+    else:
+        raise ValueError(f"Unknown history policy: {policy}")
+    return np.union1d(index, [niter - 1])
+
+
+def compact_history(zhat_list, policy = 'all', step = 10, size = 20, float32 = False, path = None):
+    '''
+    Returns the compact history of the iterates in zhat_list.
+    If path is given, the checkpoints are saved there as .npy
+    and the history holds the file name instead of the array.
+    '''
+    index = checkpoints(len(zhat_list), policy = policy, step = step, size = size)
+    zhat  = np.array([np.ravel(zhat_list[i]) for i in index])
+    if float32:
+        zhat = delta_encode(zhat)
+    hist  = dict(iter = index, encoding = "float32-delta" if float32 else "float64")
+    if path is not None:
+        np.save(path, zhat)
+        hist['file'] = os.path.basename(path)
+    else:
+        hist['zhat'] = zhat
+    return hist
+
+
+def delta_encode(zhat):
+    code = np.empty(zhat.shape, dtype = np.float32)
+    prev = np.zeros(zhat.shape[1])
+    for t in range(zhat.shape[0]):
+        # difference from the decoded previous row, so that the rounding errors do not accumulate
+        code[t] = zhat[t] - prev
+        prev   += code[t]
+    return code
+
+
+def delta_decode(code):
+    return np.cumsum(code, axis = 0, dtype = np.float64)
+
+
+def read_history(hist, dirname = None):
+    '''
+    Returns the iterations and the T x (p + 1) array of checkpoints.
+    hist can also be the list of all iterates returned by the earlier versions of fit_em_vamp.
+    The .npy file is looked up in dirname (the directory of the fit output).
+    '''
+    if not isinstance(hist, dict):
+        return np.arange(len(hist)), np.array([np.ravel(x) for x in hist])
+    if 'file' in hist:
+        zhat = np.load(os.path.join(dirname, hist['file']), mmap_mode = 'r')
+    else:
+        zhat = hist['zhat']
+    if hist['encoding'] == "float32-delta":
+        zhat = delta_decode(zhat)
+    return hist['iter'], zhat
@@ -0,0 +1,82 @@
+#
+# Tiered storage of the fitted models.
+#
+# The summary (scalars, paths and coefficients) is always kept in the DSC model output.
+# The large matrices (e.g. the (p + 1) x (p + 1) posterior covariance of EBMR) are
+#     none: dropped
+#     diag: replaced by their diagonals
+#     full: stored compressed in blocks of rows in a .npz file next to the output,
+#           and read on demand.
+# The summary records the mode and the fields in model['heavy'].
+#
+import numpy as np
+import os
+
+
+def slim_model(model, fields, mode = 'diag', path = None, chunk = 1024):
+    '''
+    Returns the summary of model, with the square matrices among fields
+    stored according to mode. For mode = 'full', path is the .npz file;
+    without path, the matrices are kept in the model.
+    path is a declared output of the DSC modules, hence it is always written
+    (empty, unless the matrices are stored in it).
+    '''
+    if mode not in ['none', 'diag', 'full']:
+        raise ValueError(f"Unknown storage mode: {mode}")
+    heavy  = [x for x in fields if isinstance(model.get(x, None), np.ndarray)
+                                   and model[x].ndim == 2 and model[x].shape[0] == model[x].shape[1]]
+    if path is not None and (mode != 'full' or len(heavy) == 0):
+        np.savez_compressed(path)
+    if len(heavy) == 0 or (mode == 'full' and path is None):
+        return model
+    slim   = {x: v for x, v in model.items() if x not in heavy}
+    info   = dict(mode = mode, fields = heavy)
+    if mode == 'diag':
+        slim.update({x: np.diag(model[x]).copy() for x in heavy})
+    elif mode == 'full':
+        blocks = dict()
+        for x in heavy:
+            for i in range(0, model[x].shape[0], chunk):
+                blocks[f"{x}.{i // chunk}"] = model[x][i:i + chunk]
+        np.savez_compressed(path, **blocks)
+        info.update(file = os.path.basename(path), chunk = chunk,
+                    shapes = {x: model[x].shape for x in heavy})
+    slim['heavy'] = info
+    return slim
+
+
+def read_heavy(model, name, dirname = None, rows = None):
+    '''
+    Read the matrix name of a summary with mode = 'full'.
+    The .npz file is looked up in dirname (the directory of the fit output).
+    If rows (slice) is given, only the blocks with these rows are decompressed.
+    '''
+    info   = model['heavy']
+    nrow   = info['shapes'][name][0]
+    chunk  = info['chunk']
+    rows   = slice(0, nrow) if rows is None else rows
+    start, stop, step = rows.indices(nrow)
+    if stop <= start:
+        return np.zeros((0,) + tuple(info['shapes'][name][1:]))
+    with np.load(os.path.join(dirname, info['file'])) as npz:
+        blocks = [npz[f"{name}.{i}"] for i in range(start // chunk, (stop - 1) // chunk + 1)]
+    x = np.concatenate(blocks, axis = 0)
+    offset = (start // chunk) * chunk
+    return x[start - offset:stop - offset:step]
+
+
+class LazyModel(dict):
+    '''
+    Summary of a model, whose matrices stored with mode = 'full'
+    are read (and kept) when they are first accessed.
+    '''
+    def __init__(self, model, dirname = None):
+        super().__init__(model)
+        self.dirname = dirname
+
+    def __missing__(self, key):
+        info = self.get('heavy', dict())
+        if info.get('mode', None) != 'full' or key not in info['fields']:
+            raise KeyError(key)
+        self[key] = read_heavy(self, key, dirname = self.dirname)
+        return self[key]
@@ -0,0 +1,74 @@
+#
+# Fused prediction and scoring of a fitted linear regression model
+# (the Python equivalent of predict.R and score.R in a single pass over Xtest).
+#
+import numpy as np
+
+METRICS = ['mse', 'mae', 'rmse_sigma', 'r2']
+
+# Fraction of non-zero coefficients below which only the support columns are used
+SPARSE_FRACTION = 0.1
+
+
+def support_columns(X, beta, sparse = SPARSE_FRACTION):
+    '''
+    Returns (X, beta) restricted to the support of beta, if it is sparse.
+    The support columns are gathered from X; for a column-major (e.g. memory-mapped)
+    X, only these columns are read.
+    '''
+    beta = np.ravel(beta).astype(np.float64)
+    idx  = np.flatnonzero(beta)
+    if idx.shape[0] >= sparse * beta.shape[0]:
+        return X, beta
+    return np.asarray(X[:, idx]), beta[idx]
+
+
+def predict_linear(X, mu, beta, chunk = 1024):
+    '''
+    Predict outcomes y = mu + X beta, in float64,
+    over blocks of rows of X (e.g. a memory-mapped dataset).
+    For a sparse beta, only the support columns of X are multiplied.
+    '''
+    X, beta = support_columns(X, beta)
+    return np.concatenate([mu + np.dot(X[i:i + chunk].astype(np.float64, copy = False), beta)
+                           for i in range(0, X.shape[0], chunk)])
+
+
+def predict_linear_matrix(X, mu, B):
+    '''
+    Predictions of several coefficient vectors (e.g. the iterates of a fit) with one GEMM,
+    Y = mu + X B for the p x T matrix B and the T intercepts mu.
+    Only the columns of X in the union of the supports of B are multiplied.
+    '''
+    idx = np.flatnonzero(np.any(B != 0, axis = 1))
+    if idx.shape[0] < SPARSE_FRACTION * B.shape[0]:
+        X, B = np.asarray(X[:, idx]), B[idx]
+    return np.dot(X, B) + np.asarray(mu).reshape(1, -1)
+
+
+def predict_score(X, mu, beta, y, sigma = None, metrics = METRICS, keep_prediction = False, chunk = 1024):
+    '''
+    Computes the predictions of y from X block by block and accumulates
+    the error metrics, without storing the predictions unless keep_prediction.
+        mse:        mean squared error
+        mae:        mean absolute error
+        rmse_sigma: root mean squared error relative to the noise sd, sigma
+        r2:         1 - SSE / SST
+    Returns the predictions (or None) and the dict of metrics.
+    '''
+    X, beta = support_columns(X, beta)
+    y     = np.ravel(y)
+    n     = X.shape[0]
+    yest  = np.empty(n) if keep_prediction else None
+    sse, sae = 0.0, 0.0
+    for i in range(0, n, chunk):
+        yblk  = mu + np.dot(X[i:i + chunk].astype(np.float64, copy = False), beta)
+        res   = y[i:i + chunk] - yblk
+        sse  += np.dot(res, res)
+        sae  += np.sum(np.abs(res))
+        if keep_prediction:
+            yest[i:i + chunk] = yblk
+    scores = dict(mse = sse / n, mae = sae / n)
+    scores['rmse_sigma'] = np.sqrt(sse / n) / sigma if sigma is not None else np.nan
+    scores['r2'] = 1 - sse / np.sum((y - np.mean(y))**2)
+    return yest, {x: scores[x] for x in metrics}
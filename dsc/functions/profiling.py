@@ -0,0 +1,98 @@
+#
+# Optional profiling records of the Python fit wrappers.
+#
+# Off by default; it is enabled for a call with profile = True / 'memory',
+# or for all calls with the environment variable
+#     EBLINREG_PROFILE=1         (timings and peak RSS)
+#     EBLINREG_PROFILE=memory    (also the peak of the Python allocations, with tracemalloc)
+# The record (see Profiler.summary) is stored as model['profile']:
+#     phases:   wall time (seconds) of each phase, e.g.
+#               setup (intercept, initialization), factorization, solve, output (I/O)
+#     iter_time: wall time of each solver iteration, where the solver reports them
+#     n_iter:   number of iterations
+#     peak_rss: peak resident set size of the process (bytes)
+#     tracemalloc_peak: largest peak of the Python allocations within a phase (bytes), with 'memory';
+#               tracemalloc runs only within the phases, so that a fit which raises
+#               does not leave it running (and slowing down) for the rest of the process
+# The dense linear algebra (BLAS / LAPACK) is in the factorization phase,
+# and in the iterations of the solvers.
+#
+import contextlib
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+_NOOP = contextlib.nullcontext()
+
+
+def profile_from_env():
+    value = os.environ.get("EBLINREG_PROFILE", "")
+    if value in ["", "0"]:
+        return False
+    return 'memory' if value == 'memory' else True
+
+
+class Profiler:
+    '''
+    Collects the wall time of the phases and iterations of a fit.
+    When disabled, phase() and iteration() return immediately.
+    '''
+    def __init__(self, profile = None):
+        if profile is None: profile = profile_from_env()
+        self.enabled   = bool(profile)
+        self.memory    = profile == 'memory'
+        self.phases    = dict()
+        self.iter_time = list()
+        self.n_iter    = None
+        self.tracemalloc_peak = 0
+        self._last     = None
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NOOP
+        return self._timed(name)
+
+    @contextlib.contextmanager
+    def _timed(self, name):
+        trace = self.memory and not tracemalloc.is_tracing()
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        self._last = start
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+            if self.memory:
+                self.tracemalloc_peak = max(self.tracemalloc_peak, tracemalloc.get_traced_memory()[1])
+            if trace:
+                tracemalloc.stop()
+
+    def iteration(self):
+        '''
+        Mark the end of an iteration (within a phase).
+        '''
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self._last is not None:
+            self.iter_time.append(now - self._last)
+        self._last = now
+
+    def summary(self, n_iter = None):
+        if not self.enabled:
+            return None
+        record = dict(phases = dict(self.phases), iter_time = list(self.iter_time),
+                      n_iter = len(self.iter_time) if n_iter is None else n_iter,
+                      peak_rss = peak_rss())
+        if self.memory:
+            record['tracemalloc_peak'] = self.tracemalloc_peak
+        return record
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
@@ -0,0 +1,105 @@
+#
+# Run several Python fit methods on one simulated dataset in a single process.
+#
+# Every DSC instance of a Python fit module starts a new interpreter,
+# imports numpy / vampyre / ebmrPy and loads the dataset again,
+# which dominates the runtime for small designs.
+# The runner loads the dataset once and runs the methods in a thread or process pool,
+# with a budget of BLAS threads for every task: a fixed limit for a thread pool
+# (the limits are process-global), or the core budget of threads.py in every worker
+# of a process pool, within which every fit sizes its own number of threads.
+# For each method, it writes <outdir>/<method>.pkl with the outputs of the DSC fit modules
+# (intercept, beta_est, model), which are read by dsc_io.load_dsc / flex_read.
+#
+# Usage:
+#     python runner.py <datafile> <outdir> [--methods ebmr_ash em_vamp ...]
+#                      [--workers 4] [--blas-threads 1] [--pool thread|process]
+#
+import numpy as np
+import argparse
+import concurrent.futures
+import os
+import pickle
+
+from dataset import read_dataset
+import fit
+from threads import blas_limit, fixed_threads
+
+
+# Python fit modules: fit function and its arguments
+METHODS = {
+    'ebmr_ash':    (fit.fit_ebmr_base, dict(prior = 'mix_point')),
+    'ebmr_lasso':  (fit.fit_ebmr_base, dict(prior = 'dexp')),
+    'em_iridge':   (fit.fit_iridge,    dict()),
+    'em_vamp':     (fit.fit_em_vamp,   dict()),
+    'em_vamp_ash': (fit.fit_em_vamp,   fit.vamp_ash_grid(ncomp = 20)),
+}
+
+
+def run_method(method, X, y, outdir, **kwargs):
+    func, margs = METHODS[method]
+    args = dict(margs, **kwargs)
+    if func is fit.fit_em_vamp and args.get('history', None) is not None:
+        args['history_file'] = os.path.join(outdir, f"{method}.npy")
+    model, intercept, beta = func(X, y, **args)
+    outfile = os.path.join(outdir, f"{method}.pkl")
+    with open(outfile, 'wb') as fh:
+        pickle.dump(dict(intercept = intercept, beta_est = beta, model = model), fh)
+    return outfile
+
+
+def _run_from_file(method, datafile, outdir, kwargs):
+    data = read_dataset(datafile, ['X', 'y'])
+    return run_method(method, data['X'], np.array(data['y']), outdir, **kwargs)
+
+
+def run_methods(datafile, outdir, methods = None, workers = 1, blas_threads = 1, pool = 'thread', **kwargs):
+    '''
+    Run the methods (default: all) on the dataset (manifest datafile).
+    kwargs are passed to every fit function (e.g. tol; patience and max_time only apply to em_vamp).
+    In a thread pool, the BLAS limit is process-global, hence it is fixed to blas_threads
+    for the whole pool (the fits do not size their own threads) and the total is
+    workers x blas_threads; a process pool sets the limit in every worker,
+    where every fit sizes its threads within the core budget blas_threads,
+    and memory-maps the dataset again (without a copy).
+    Returns a dict of the output file of every method.
+    '''
+    if methods is None: methods = list(METHODS.keys())
+    if pool not in ['thread', 'process']:
+        raise ValueError(f"Unknown pool: {pool}")
+    os.makedirs(outdir, exist_ok = True)
+    budget = os.environ.get("EBLINREG_CORE_BUDGET", None)
+    os.environ["EBLINREG_CORE_BUDGET"] = f"{blas_threads}"
+    try:
+        if pool == 'thread':
+            data    = read_dataset(datafile, ['X', 'y'])
+            X, y    = data['X'], np.array(data['y'])
+            with fixed_threads(blas_threads), \
+                 concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+                futures = {x: executor.submit(run_method, x, X, y, outdir, **kwargs) for x in methods}
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers = workers,
+                                                        initializer = blas_limit, initargs = (blas_threads,)) as executor:
+                futures = {x: executor.submit(_run_from_file, x, datafile, outdir, kwargs) for x in methods}
+    finally:
+        # the workers have inherited the budget
+        if budget is None:
+            del os.environ["EBLINREG_CORE_BUDGET"]
+        else:
+            os.environ["EBLINREG_CORE_BUDGET"] = budget
+    return {x: f.result() for x, f in futures.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Run the Python fit methods on one dataset.")
+    parser.add_argument("datafile")
+    parser.add_argument("outdir")
+    parser.add_argument("--methods",      nargs = '+', choices = list(METHODS.keys()), default = None)
+    parser.add_argument("--workers",      type = int, default = 1)
+    parser.add_argument("--blas-threads", type = int, default = 1)
+    parser.add_argument("--pool",         choices = ['thread', 'process'], default = 'thread')
+    opts   = parser.parse_args()
+    result = run_methods(opts.datafile, opts.outdir, methods = opts.methods, workers = opts.workers,
+                         blas_threads = opts.blas_threads, pool = opts.pool)
+    for method, outfile in result.items():
+        print(f"{method}: {outfile}")
@@ -1,5 +1,11 @@
 import numpy as np
 import collections
+import math
+import os
+import tempfile
+from scipy.sparse.linalg import LinearOperator
+
+from dataset import read_dataset, write_dataset
 
 def parse_input_params(dims, sfrac=0.5, sfix=None):
     n = dims[0]
@@ -10,17 +16,27 @@ def parse_input_params(dims, sfrac=0.5, sfix=None):
         s = max(1, int(sfrac * p))
     return n, p, s
 
-def sample_betas (p, bidx, method="normal", bfix=None):
+def replicate_rngs(seed, nrep, start = 0):
+    '''
+    Independent random generators for replicates start, ..., start + nrep - 1.
+    The stream of each replicate depends only on the seed and the replicate index,
+    and is the same as the one obtained from np.random.SeedSequence(seed).spawn().
+    '''
+    return [np.random.default_rng(np.random.SeedSequence(seed, spawn_key = (i,))) for i in range(start, start + nrep)]
+
+
+def sample_betas (p, bidx, method="normal", bfix=None, rng=None):
     beta = np.zeros(p)
     s = bidx.shape[0]
+    if rng is None: rng = np.random
 
     # helper function to obtain random sign (+1, -1) with equal proportion (f = 0.5)
     def sample_sign(n, f = 0.5):
-        return np.random.choice([-1, 1], size=n, p=[f, 1 - f])
+        return rng.choice([-1, 1], size=n, p=[f, 1 - f])
 
     # sample beta from Gaussian(mean = 0, sd = 1)
     if method == "normal":
-        beta[bidx] = np.random.normal(size = s)
+        beta[bidx] = rng.normal(size = s)
 
     # receive fixed beta input
     elif method == "fixed":
@@ -34,51 +50,285 @@ def sample_betas (p, bidx, method="normal", bfix=None):
     # sample beta from a Gamma(40, 0.1) distribution and assign random sign
     elif method == "gamma":
         params = [40, 0.1]
-        beta[bidx] = np.random.gamma(params[0], params[1], size = s)
+        beta[bidx] = rng.gamma(params[0], params[1], size = s)
         beta[bidx] = np.multiply(beta[bidx], sample_sign(s))
 
     return beta
 
 
-def get_responses (X, b, sd):
-    return np.dot(X, b) + sd * np.random.normal(size = X.shape[0])
+def get_responses (X, b, sd, rng=None):
+    if rng is None: rng = np.random
+    return design_dot(X, b) + sd * rng.normal(size = X.shape[0])
 
 
 def get_sd_from_pve (X, b, pve):
-    return np.sqrt(np.var(np.dot(X, b)) * (1 - pve) / pve)
+    return np.sqrt(np.var(design_dot(X, b)) * (1 - pve) / pve)
+
+
+def design_dot(X, b, chunk = 256):
+    '''
+    X b in float64. A single precision X is promoted in blocks of rows,
+    instead of a float64 copy of the whole matrix.
+    '''
+    if not isinstance(X, np.ndarray) or X.dtype == np.float64:
+        return X.dot(b)
+    return np.concatenate([np.dot(X[i:i + chunk].astype(np.float64), b) for i in range(0, X.shape[0], chunk)])
+
+
+def normal_rows(rng, nrow, ncol, dtype = np.float64, chunk = 256):
+    '''
+    nrow x ncol standard normal draws, stored as dtype.
+    The draws are the same as rng.normal(size = (nrow, ncol)) rounded to dtype,
+    but a single precision array is filled in blocks of rows, without a float64 copy.
+    '''
+    if np.dtype(dtype) == np.float64:
+        return rng.normal(size = nrow * ncol).reshape(nrow, ncol)
+    x = np.empty((nrow, ncol), dtype = dtype)
+    for i in range(0, nrow, chunk):
+        x[i:i + chunk] = rng.normal(size = (min(chunk, nrow - i), ncol))
+    return x
     
 
-def equicorr_predictors (n, p, s, pve, signal = "normal", seed = None, rho = 0.5, bfix = None):
+def equicorr_predictors (n, p, s, pve, signal = "normal", seed = None, rho = 0.5, bfix = None,
+                         structured = False, rng = None, dtype = np.float64):
     '''
     X is sampled from a multivariate normal, with covariance matrix S.
     S has unit diagonal entries and constant off-diagonal entries rho.
+    The iid part is scaled and shifted in place, so that only one 2n x p array is allocated.
+    If structured is True, X and Xtest are returned as EquicorrGaussDesign,
+    which keeps the shared factor and the iid part separately.
+    The random numbers are drawn from rng (default: the global np.random state).
+    X and Xtest are stored as dtype (e.g. np.float32); y and ytest are float64.
     '''
     if seed is not None: np.random.seed(seed)
-    iidX  = np.random.normal(size = n * 2 * p).reshape(n * 2, p)
-    comR  = np.random.normal(size = n * 2).reshape(n * 2, 1)
-    Xall  = comR * np.sqrt(rho) + iidX * np.sqrt(1 - rho)
+    if rng is None: rng = np.random
+    iidX  = normal_rows(rng, n * 2, p, dtype = dtype)
+    comR  = rng.normal(size = n * 2).reshape(n * 2, 1)
+    # split into training and test data
+    if structured:
+        X     = EquicorrGaussDesign(comR[:n, 0], iidX[:n, :], rho)
+        Xtest = EquicorrGaussDesign(comR[n:, 0], iidX[n:, :], rho)
+    else:
+        Xall  = iidX
+        Xall *= np.sqrt(1 - rho)
+        Xall += (comR * np.sqrt(rho)).astype(dtype)
+        X     = Xall[:n, :]
+        Xtest = Xall[n:, :]
+    # sample betas
+    bidx  = rng.choice(p, s, replace = False)
+    beta  = sample_betas(p, bidx, method = signal, bfix = bfix, rng = rng)
+    # obtain sd from pve
+    se    = get_sd_from_pve(X, beta, pve)
+    # calculate the responses
+    y     = get_responses(X,     beta, se, rng = rng)
+    ytest = get_responses(Xtest, beta, se, rng = rng)
+    return X, y, Xtest, ytest, beta, se
+
+
+def equicorr_predictors_batch (n, p, s, pve, nrep, signal = "normal", seed = None, rho = 0.5, bfix = None,
+                               start = 0):
+    '''
+    Generates replicates start, ..., start + nrep - 1 of equicorr_predictors in one call.
+    Each replicate draws from its own stream (see replicate_rngs), in the same order as
+    equicorr_predictors(..., rng = replicate_rngs(seed, 1, start = i)[0]),
+    hence the data do not depend on how the replicates are batched.
+    Returns stacked arrays, with the replicates along the first axis.
+    '''
+    rngs  = replicate_rngs(seed, nrep, start = start)
+    Xall  = np.empty((nrep, n * 2, p))
+    comR  = np.empty((nrep, n * 2, 1))
+    beta  = np.zeros((nrep, p))
+    noise = np.empty((nrep, n * 2))
+    for i, rng in enumerate(rngs):
+        rng.standard_normal(out = Xall[i])
+        rng.standard_normal(out = comR[i])
+        bidx     = rng.choice(p, s, replace = False)
+        beta[i]  = sample_betas(p, bidx, method = signal, bfix = bfix, rng = rng)
+        rng.standard_normal(out = noise[i])
+    Xall *= np.sqrt(1 - rho)
+    Xall += comR * np.sqrt(rho)
     # split into training and test data
+    X     = Xall[:, :n, :]
+    Xtest = Xall[:, n:, :]
+    # obtain sd from pve and calculate the responses
+    Xb    = np.matmul(Xall, beta[:, :, np.newaxis])[:, :, 0]
+    se    = np.sqrt(np.var(Xb[:, :n], axis = 1) * (1 - pve) / pve)
+    yall  = Xb + se[:, np.newaxis] * noise
+    return X, yall[:, :n], Xtest, yall[:, n:], beta, se
+
+
+def equicorr_design (n, p, rho, replicate, seed = 0, cache_dir = None, dtype = np.float64):
+    '''
+    Common design (X, Xtest) for all settings with the same (n, p, rho, replicate),
+    drawn from its own stream keyed on (seed, n, p, rho, replicate).
+    A single precision design (dtype) has the same draws, rounded.
+    If cache_dir is given, the design is stored there as a memory-mapped dataset
+    and mapped (read-only) by subsequent calls.
+    '''
+    if cache_dir is not None:
+        manifest = equicorr_design_manifest(n, p, rho, replicate, seed = seed, cache_dir = cache_dir, dtype = dtype)
+        if os.path.isfile(manifest):
+            data = read_dataset(manifest)
+            return data['X'], data['Xtest']
+    rng   = np.random.default_rng(np.random.SeedSequence(seed, spawn_key = (0, n, p, _float_key(rho), replicate)))
+    Xall  = normal_rows(rng, n * 2, p, dtype = dtype)
+    comR  = rng.standard_normal((n * 2, 1))
+    Xall *= np.sqrt(1 - rho)
+    Xall += (comR * np.sqrt(rho)).astype(dtype)
     X     = Xall[:n, :]
     Xtest = Xall[n:, :]
+    if cache_dir is not None:
+        # Concurrent module instances may generate the same design.
+        # Write in a private directory and move the files in place, the manifest last,
+        # so that readers never see a partially written design.
+        os.makedirs(cache_dir, exist_ok = True)
+        tmpdir   = tempfile.mkdtemp(dir = cache_dir)
+        write_dataset(os.path.join(tmpdir, os.path.basename(manifest)), X = X, Xtest = Xtest)
+        tmpfiles = sorted(os.listdir(tmpdir), key = lambda x: x.endswith(".txt"))
+        for f in tmpfiles:
+            os.replace(os.path.join(tmpdir, f), os.path.join(cache_dir, f))
+        os.rmdir(tmpdir)
+    return X, Xtest
+
+
+def equicorr_design_manifest (n, p, rho, replicate, seed = 0, cache_dir = None, dtype = np.float64):
+    '''
+    Manifest of the cached design in cache_dir (see equicorr_design).
+    '''
+    suffix = "" if np.dtype(dtype) == np.float64 else f"_{np.dtype(dtype).name}"
+    return os.path.join(cache_dir, f"equicorr_{n}x{p}_rho{rho:g}_seed{seed}_rep{replicate}{suffix}.txt")
+
+
+def equicorr_predictors_crn (n, p, s, pve, replicate, signal = "normal", seed = 0, rho = 0.5, bfix = None,
+                             cache_dir = None, dtype = np.float64):
+    '''
+    Common random numbers (CRN) variant of equicorr_predictors.
+    X and Xtest are shared by all settings of s and pve for the same (n, p, rho, replicate),
+    see equicorr_design. Only the coefficients, the noise scale and the responses
+    are drawn for each setting, from a stream keyed on (seed, n, p, rho, replicate, s, pve).
+    '''
+    X, Xtest = equicorr_design(n, p, rho, replicate, seed = seed, cache_dir = cache_dir, dtype = dtype)
+    rng   = np.random.default_rng(np.random.SeedSequence(seed, 
+                spawn_key = (1, n, p, _float_key(rho), replicate, s, _float_key(pve))))
     # sample betas
-    bidx  = np.random.choice(p, s, replace = False)
-    beta  = sample_betas(p, bidx, method = signal, bfix = bfix)
+    bidx  = rng.choice(p, s, replace = False)
+    beta  = sample_betas(p, bidx, method = signal, bfix = bfix, rng = rng)
     # obtain sd from pve
     se    = get_sd_from_pve(X, beta, pve)
     # calculate the responses
-    y     = get_responses(X,     beta, se)
-    ytest = get_responses(Xtest, beta, se)
+    y     = get_responses(X,     beta, se, rng = rng)
+    ytest = get_responses(Xtest, beta, se, rng = rng)
     return X, y, Xtest, ytest, beta, se
 
 
-def changepoint_predictors (n, p, s, snr, k = 0, signal = "normal", seed = None, bfix = None, center_sticky = True):
+def _float_key(x):
+    # SeedSequence keys must be non-negative integers
+    return int(round(x * 1e6))
+
+
+class EquicorrGaussDesign(LinearOperator):
+    '''
+    Equicorrelated design X = sqrt(rho) * c 1^T + sqrt(1 - rho) * Z,
+    where c is the shared factor (length n) and Z is the n x p iid part.
+    Products with X and X.T are computed from c and Z,
+    without forming the dense matrix.
+    '''
+    def __init__(self, factor, iid, rho):
+        super().__init__(dtype = iid.dtype, shape = iid.shape)
+        self.factor = factor
+        self.iid    = iid
+        self.rho    = rho
+
+    def _matvec(self, b):
+        return self._matmat(b.reshape(-1, 1))
+
+    def _rmatvec(self, r):
+        return self._rmatmat(r.reshape(-1, 1))
+
+    def _matmat(self, B):
+        res  = np.dot(self.iid, B)
+        res *= np.sqrt(1 - self.rho)
+        res += np.sqrt(self.rho) * np.outer(self.factor, np.sum(B, axis = 0))
+        return res
+
+    def _rmatmat(self, R):
+        res  = np.dot(self.iid.T, R)
+        res *= np.sqrt(1 - self.rho)
+        res += np.sqrt(self.rho) * np.dot(self.factor, R)
+        return res
+
+    def todense(self, out = None):
+        '''
+        Returns the dense matrix X. Use out = self.iid to overwrite the iid part in place.
+        '''
+        if out is None:
+            out = self.iid.copy()
+        elif out is not self.iid:
+            out[:] = self.iid
+        out *= np.sqrt(1 - self.rho)
+        out += self.factor.reshape(-1, 1) * np.sqrt(self.rho)
+        return out
+
+
+def changepoint_predictors (n, p, s, snr, k = 0, signal = "normal", seed = None, bfix = None, center_sticky = True,
+                            operator = False, rng = None, dtype = np.float64):
     '''
     Trend-filtering data. 
+    X and Xtest are the same (read-only) basis.
+    If operator is True, the basis is returned as an implicit TrendFilteringBasis
+    instead of a dense n x p matrix.
+    The random numbers are drawn from rng (default: the global np.random state).
+    A dense basis is stored as dtype.
     '''
     if seed is not None: np.random.seed(seed)
-    X     = trend_filtering_basis(n, p, k)
-    Xtest = X.copy()
+    X     = TrendFilteringBasis(n, p, k) if operator else trend_filtering_basis(n, p, k).astype(dtype, copy = False)
+    Xtest = X
+    if rng is None: rng = np.random
     # sample betas
+    bidx   = changepoint_bidx(n, p, s, k, center_sticky = center_sticky, rng = rng)
+    # obtain values of beta
+    beta   = sample_betas(p, bidx, method = signal, bfix = bfix, rng = rng)
+    # obtain sd from signal-to-noise ratio
+    signal = np.mean(np.abs(beta[beta!=0]))
+    se     = signal / snr
+    # calculate the responses
+    y      = get_responses(X,     beta, se, rng = rng)
+    ytest  = get_responses(Xtest, beta, se, rng = rng)
+    return X, y, Xtest, ytest, beta, se
+
+
+def changepoint_predictors_batch (n, p, s, snr, nrep, k = 0, signal = "normal", seed = None, bfix = None,
+                                  center_sticky = True, operator = False, start = 0):
+    '''
+    Generates replicates start, ..., start + nrep - 1 of changepoint_predictors in one call,
+    each from its own stream (see replicate_rngs).
+    The basis is the same for all replicates; X and Xtest are read-only views
+    stacked along the first axis (or the TrendFilteringBasis itself, if operator is True).
+    '''
+    rngs   = replicate_rngs(seed, nrep, start = start)
+    X      = TrendFilteringBasis(n, p, k) if operator else trend_filtering_basis(n, p, k)
+    beta   = np.zeros((nrep, p))
+    noise  = np.empty((nrep, n * 2))
+    for i, rng in enumerate(rngs):
+        bidx     = changepoint_bidx(n, p, s, k, center_sticky = center_sticky, rng = rng)
+        beta[i]  = sample_betas(p, bidx, method = signal, bfix = bfix, rng = rng)
+        rng.standard_normal(out = noise[i])
+    # obtain sd from signal-to-noise ratio
+    se     = np.array([np.mean(np.abs(b[b!=0])) for b in beta]) / snr
+    # calculate the responses
+    Xb     = X.dot(beta.T).T
+    y      = Xb + se[:, np.newaxis] * noise[:, :n]
+    ytest  = Xb + se[:, np.newaxis] * noise[:, n:]
+    if not operator:
+        X  = np.broadcast_to(X, (nrep, n, p))
+    return X, y, X, ytest, beta, se
+
+
+def changepoint_bidx(n, p, s, k, center_sticky = True, rng = None):
+    '''
+    Indices of the non-zero coefficients for the changepoint predictors.
+    '''
+    if rng is None: rng = np.random
     m = min(n, p)
     imin = k + 1
     imax = m
@@ -89,44 +339,118 @@ def changepoint_predictors (n, p, s, snr, k = 0, signal = "normal", seed = None,
             imin = max(imin, int (imax / 2))
         bidx = np.array([int((imin + imax)/2)])
     else:
-        bidx  = np.random.choice(np.arange(imin, imax), s, replace = False)
-    # obtain values of beta
-    beta   = sample_betas(p, bidx, method = signal, bfix = bfix)
-    # obtain sd from signal-to-noise ratio
-    signal = np.mean(np.abs(beta[beta!=0]))
-    se     = signal / snr
-    # calculate the responses
-    y      = get_responses(X,     beta, se)
-    ytest  = get_responses(Xtest, beta, se)
-    return X, y, Xtest, ytest, beta, se
+        bidx  = rng.choice(np.arange(imin, imax), s, replace = False)
+    return bidx
 
 
 def trend_filtering_basis(n, p, k):
     '''
     adapted from [Tibshirani, 2014](https://doi.org/10.1214/13-AOS1189)
     Equation (22) [page 303]
+    The m x m basis (m = min(n, p)) is filled in place in the top left block of G,
+    without looping over the columns.
     '''
     m = min(n, p)
-    X = np.zeros((m, m))
+    G = np.zeros((n, p))
+    X = G[:m, :m]
+    rows = np.arange(m).reshape(m, 1)
     if k == 0:
-        for j in range(m):
-            X[j:m, j] = 1
+        # X[i, j] = 1 for i >= j
+        np.greater_equal(rows, np.arange(m), out = X)
     else:
         # j = 1, ..., k+1
         seq = np.arange(1, m+1).reshape(m,1)
-        X[:, :k + 1] = np.power(np.tile(seq, k+1), np.arange(k+1)) / np.power(m, np.arange(k+1))
+        X[:, :k + 1] = np.power(seq, np.arange(k+1)) / np.power(m, np.arange(k+1))
         # j > k + 1
-        for j in range(k+1, m):
-            khalf = int(k / 2) if k % 2 == 0 else int((k + 1) / 2)
-            X[(j - khalf + 1):, j] = np.power(np.arange(j - khalf + 1, m) - j + khalf, k) / np.power(m, k)
-    G = np.zeros((n, p))
-    if n >= p:
-        G[:p, :] = X
-    else:
-        G[:, :n] = X
+        # X[i, j] = (i - j + khalf)^k / m^k for i > j - khalf
+        khalf = _trend_filtering_khalf(k)
+        Xs = X[:, k + 1:]
+        np.subtract(rows, np.arange(k + 1, m) - khalf, out = Xs)
+        np.maximum(Xs, 0, out = Xs)
+        np.power(Xs, k, out = Xs)
+        Xs /= np.power(m, k)
     return G
 
 
+def _trend_filtering_khalf(k):
+    return int(k / 2) if k % 2 == 0 else int((k + 1) / 2)
+
+
+class TrendFilteringBasis(LinearOperator):
+    '''
+    Implicit n x p trend filtering basis of order k,
+    equivalent to the dense matrix returned by trend_filtering_basis(n, p, k).
+    Products with X and X.T are computed with (k + 1) cumulative sums
+    in O(n k) time, without building the dense matrix.
+    For k > 0, the truncated powers d^k are expanded in the basis
+    C(d + l - 1, l), l = 1, ..., k, which is generated by repeated cumulative sums.
+    '''
+    def __init__(self, n, p, k):
+        super().__init__(dtype = np.float64, shape = (n, p))
+        self.k     = k
+        self.m     = min(n, p)
+        self.khalf = _trend_filtering_khalf(k)
+        # polynomial columns, j = 1, ..., k+1
+        seq        = np.arange(1, self.m + 1).reshape(self.m, 1)
+        self.poly  = np.power(seq, np.arange(k + 1)) / np.power(self.m, np.arange(k + 1))
+        # d^k = sum_l coef[l - 1] * C(d + l - 1, l) for d >= 1
+        if k > 0:
+            d = np.arange(1, k + 1)
+            A = np.array([[math.comb(int(di) + l - 1, l) for l in range(1, k + 1)] for di in d])
+            self.coef = np.linalg.solve(A, np.power(d, k).astype(float)) / np.power(self.m, k)
+
+    def _matvec(self, b):
+        return self._matmat(b.reshape(-1, 1))
+
+    def _rmatvec(self, r):
+        return self._rmatmat(r.reshape(-1, 1))
+
+    def _matmat(self, B):
+        n, p   = self.shape
+        m, k   = self.m, self.k
+        res    = np.zeros((n, B.shape[1]), dtype = np.result_type(self.dtype, B.dtype))
+        if k == 0:
+            np.cumsum(B[:m], axis = 0, out = res[:m])
+            return res
+        res[:m]  = np.dot(self.poly, B[:k + 1])
+        # Column j contributes to rows i with i + khalf - 1 >= j,
+        # hence the cumulative sums are read with an offset of (khalf - 1).
+        Bs       = np.zeros((m + self.khalf - 1, B.shape[1]), dtype = res.dtype)
+        Bs[k + 1:m] = B[k + 1:m]
+        for l, csum in enumerate(self._cumsums(Bs)):
+            res[:m] += self.coef[l] * csum[self.khalf - 1:]
+        return res
+
+    def _rmatmat(self, R):
+        n, p   = self.shape
+        m, k   = self.m, self.k
+        res    = np.zeros((p, R.shape[1]), dtype = np.result_type(self.dtype, R.dtype))
+        if k == 0:
+            res[:m] = np.cumsum(R[m - 1::-1], axis = 0)[::-1]
+            return res
+        res[:k + 1] = np.dot(self.poly.T, R[:m])
+        # Column j collects rows i >= j - khalf + 1
+        # from the reverse cumulative sums.
+        jmin, jmax  = k + 2 - self.khalf, m - self.khalf + 1
+        for l, csum in enumerate(self._cumsums(R[m - 1::-1])):
+            res[k + 1:m] += self.coef[l] * csum[::-1][jmin:jmax]
+        return res
+
+    def _cumsums(self, B):
+        '''
+        Yields the 2nd, ..., (k+1)-th repeated cumulative sums of B along the rows,
+        the l-th of which is sum_j B[j] C(i - j + l - 1, l - 1).
+        '''
+        csum = np.cumsum(B, axis = 0)
+        for l in range(self.k):
+            csum = np.cumsum(csum, axis = 0)
+            yield csum
+
+    def todense(self):
+        n, p = self.shape
+        return trend_filtering_basis(n, p, self.k)
+
+
 def sample_betas_fixtrend(p, s, bfix):
     '''
     a special trend filtering where non-zero coefficients appear in pairs,
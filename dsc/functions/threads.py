@@ -0,0 +1,132 @@
+#
+# Budget of BLAS / OpenMP threads for the Python fit wrappers.
+#
+# The cluster configurations (e.g. midway2.yml) export OMP_NUM_THREADS=1 for all modules.
+# Instead, every fit call picks its number of threads from the size of its dominant
+# dense linear algebra (which depends on n, p and the method), within the core budget
+# of the module instance, so that small fits stay single-threaded (no oversubscription)
+# and large factorizations use the idle cores of the instance.
+#
+# The core budget is read from the environment variable
+#     EBLINREG_CORE_BUDGET=<cores>
+# which should be equal to cpus_per_instance of the DSC host configuration.
+# If it is not set, the limits are left alone (the earlier behavior),
+# e.g. OMP_NUM_THREADS=16 of gwdg.yml applies to all fits.
+# EBLINREG_THREADS=<threads> fixes the number of threads for all calls.
+#
+# The limits are changed at runtime with threadpoolctl (optional);
+# without it, the environment variables only apply to BLAS libraries loaded later,
+# e.g. in a new worker process, and the limits of the fits have no effect (with a warning).
+#
+import contextlib
+import os
+import warnings
+
+BLAS_ENV = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]
+
+# Size of a dense operation (flops) worth one more thread
+FLOPS_PER_THREAD = 1e8
+
+
+def core_budget():
+    '''
+    Core budget of the instance, or None if it is not set.
+    '''
+    budget = os.environ.get("EBLINREG_CORE_BUDGET", None)
+    return None if budget is None else int(budget)
+
+
+def method_flops(n, p, method):
+    '''
+    Flops of the dominant dense operation of one iteration / factorization.
+        ebmr_direct, iridge: (p + 1) x (p + 1) posterior covariance, from X^T X and its inverse
+        ebmr_woodbury:       n x n dual system, from X X^T
+        em_vamp, ridge: thin SVD of [1, X]
+    '''
+    p1 = p + 1
+    if method in ['ebmr_direct', 'iridge']:
+        return n * p1**2 + p1**3
+    elif method == 'ebmr_woodbury':
+        return p1 * n**2 + n**3
+    elif method in ['em_vamp', 'ridge']:
+        return min(n, p1)**2 * max(n, p1)
+    else:
+        raise ValueError(f"Unknown method for thread sizing: {method}")
+
+
+def size_threads(n, p, method, budget = None):
+    '''
+    Number of threads for a fit of method on an n x p design,
+    one for every FLOPS_PER_THREAD of its dominant operation, between 1 and the budget.
+    Returns None without a budget (the limits are not changed).
+    '''
+    if "EBLINREG_THREADS" in os.environ:
+        return int(os.environ["EBLINREG_THREADS"])
+    if budget is None: budget = core_budget()
+    if budget is None:
+        return None
+    return max(1, min(budget, int(method_flops(n, p, method) // FLOPS_PER_THREAD)))
+
+
+def blas_limit(nthreads):
+    '''
+    Limit the number of BLAS threads of this process.
+    '''
+    for var in BLAS_ENV:
+        os.environ[var] = f"{nthreads}"
+    _threadpool_limits(nthreads)
+    return
+
+
+@contextlib.contextmanager
+def thread_budget(shape, method, budget = None):
+    '''
+    Run the enclosed fit with the number of BLAS threads sized for an n x p (shape) design.
+    The earlier limits are restored on exit.
+    Within fixed_threads, or without a core budget, the limits are not changed.
+    '''
+    if _fixed_threads is not None:
+        yield _fixed_threads
+        return
+    n, p     = shape
+    nthreads = size_threads(n, p, method, budget = budget)
+    if nthreads is None:
+        yield None
+        return
+    with _threadpool_limits(nthreads):
+        yield nthreads
+
+
+# Number of threads fixed by fixed_threads for the whole process, or None
+_fixed_threads = None
+
+
+@contextlib.contextmanager
+def fixed_threads(nthreads):
+    '''
+    Fix the number of BLAS threads of the process for the enclosed block,
+    e.g. a thread pool of fits. The limits are process-global, hence thread_budget
+    does not change them within the block: concurrent fits would otherwise overwrite
+    and restore the limits of each other.
+    '''
+    global _fixed_threads
+    previous       = _fixed_threads
+    _fixed_threads = nthreads
+    try:
+        with _threadpool_limits(nthreads):
+            yield nthreads
+    finally:
+        _fixed_threads = previous
+
+
+def _threadpool_limits(nthreads):
+    '''
+    Limits of the BLAS threads (restored on exit, if used as a context manager).
+    '''
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        warnings.warn("threadpoolctl is not installed: the number of BLAS threads "
+                      "cannot be changed after the BLAS library is loaded", RuntimeWarning)
+        return contextlib.nullcontext()
+    return threadpool_limits(limits = nthreads, user_api = 'blas')
@@ -0,0 +1,59 @@
+#
+# Opt-in store of converged fits, used to warm-start the Python fit wrappers.
+#
+# Entries are keyed by the content hash of the design and the method,
+# and each entry is labelled by the simulation setting, e.g. (s, se).
+# A new fit on the same design is initialized from the entry
+# with the nearest setting (on the log scale).
+#
+# Layout: <store>/<design hash>/<method>/<setting>.npz
+#
+import numpy as np
+import os
+import tempfile
+
+
+def setting_label(setting):
+    return "_".join([f"{x:g}" for x in setting])
+
+
+def setting_distance(setting, other):
+    x = np.log(np.abs(np.array(setting, dtype = float)) + 1e-12)
+    y = np.log(np.abs(np.array(other,   dtype = float)) + 1e-12)
+    return np.sum(np.abs(x - y))
+
+
+def lookup(store, key, method, setting):
+    '''
+    Returns the dict of arrays saved for the nearest setting, or None.
+    '''
+    mdir = os.path.join(store, key, method)
+    if not os.path.isdir(mdir):
+        return None
+    entries = list()
+    for name in os.listdir(mdir):
+        if not name.endswith(".npz"): continue
+        try:
+            with np.load(os.path.join(mdir, name)) as npz:
+                params = {x: npz[x] for x in npz.files}
+        except (OSError, ValueError):
+            # being replaced by a concurrent instance
+            continue
+        entries.append((setting_distance(setting, params['setting']), name, params))
+    if len(entries) == 0:
+        return None
+    return sorted(entries, key = lambda x: (x[0], x[1]))[0][2]
+
+
+def save(store, key, method, setting, **params):
+    '''
+    Save the converged parameters (numbers / arrays; None is skipped) for this setting.
+    '''
+    mdir = os.path.join(store, key, method)
+    os.makedirs(mdir, exist_ok = True)
+    params = {x: np.asarray(v) for x, v in params.items() if v is not None}
+    fd, tmpfile = tempfile.mkstemp(dir = mdir, suffix = ".tmp")
+    with os.fdopen(fd, 'wb') as fh:
+        np.savez(fh, setting = np.array(setting, dtype = float), **params)
+    os.replace(tmpfile, os.path.join(mdir, f"{setting_label(setting)}.npz"))
+    return
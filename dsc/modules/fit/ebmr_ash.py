@@ -1,4 +1,9 @@
 # This python script implements the "ebmr_ash" module.
 from fit import fit_ebmr_base
-model, mu, beta = fit_ebmr_base(X, y, prior='mix_point')
+from dataset import read_dataset
+
+X = read_dataset(datafile, ['X'])['X']
+model, mu, beta = fit_ebmr_base(X, y, prior='mix_point', tol = tol,
+                                warm_start = warm_start, setting = (s, se),
+                                sigma = sigma, inverse = inverse, heavy = heavy, heavy_file = heavyfile)
 
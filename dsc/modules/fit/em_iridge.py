@@ -1,4 +1,8 @@
 # This python script implements the "em_iridge" module.
 from fit import fit_iridge
-model, mu, beta = fit_iridge(X, y)
+from dataset import read_dataset
+
+X = read_dataset(datafile, ['X'])['X']
+model, mu, beta = fit_iridge(X, y, tol = tol,
+                             warm_start = warm_start, setting = (s, se))
 
@@ -1,4 +1,10 @@
 # This python script implements the "em_vamp" module.
 from fit import fit_em_vamp
-model, mu, beta = fit_em_vamp(X, y)
+from dataset import read_dataset
+
+X = read_dataset(datafile, ['X'])['X']
+model, mu, beta = fit_em_vamp(X, y, history = history, history_step = history_step, history_size = history_size,
+                              history_float32 = history_float32, history_file = histfile,
+                              tol = tol, patience = patience, max_time = max_time,
+                              warm_start = warm_start, setting = (s, se), svd = svd)
 
@@ -1,14 +1,11 @@
 # This python script implements the "em_vamp_ash" module.
-from fit import fit_em_vamp
-import numpy as np
+from fit import fit_em_vamp, vamp_ash_grid
+from dataset import read_dataset
 
-ncomp    = 20
-probc    = None
-meanc    = np.zeros(ncomp)
-varc     = (4**(np.arange(ncomp)/ncomp) - 1)**2
-varc[0]  = 1e-4
-mean_fix = np.ones(ncomp)
-var_fix  = np.ones(ncomp)
-model, mu, beta = fit_em_vamp(X, y, probc = probc, meanc = meanc, varc  = varc, 
-                              mean_fix = mean_fix, var_fix  = var_fix)
+X = read_dataset(datafile, ['X'])['X']
 
+model, mu, beta = fit_em_vamp(X, y, **vamp_ash_grid(ncomp = 20),
+                              history = history, history_step = history_step, history_size = history_size,
+                              history_float32 = history_float32, history_file = histfile,
+                              tol = tol, patience = patience, max_time = max_time,
+                              warm_start = warm_start, setting = (s, se), svd = svd)
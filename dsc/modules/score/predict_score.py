@@ -0,0 +1,10 @@
+# This python script implements the "predict_score" module in the linreg DSC.
+from dataset import read_dataset
+from predict import predict_score
+
+X = read_dataset(datafile, ['Xtest'])['Xtest']
+yest, scores = predict_score(X, intercept, beta, y, sigma = sigma, keep_prediction = keep_yest)
+err  = scores['mse']
+mae  = scores['mae']
+rmse = scores['rmse_sigma']
+r2   = scores['r2']
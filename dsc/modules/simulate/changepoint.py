@@ -1,5 +1,8 @@
 #
 import simulate
+from dataset import write_dataset
 
 n, p, s = simulate.parse_input_params (dims, sfix = sfix)
-X, y, Xtest, ytest, beta, sigma = simulate.changepoint_predictors (n, p, s, snr, k = basis_k, signal = signal, seed = None, bfix = bfix, center_sticky = True)
+X, y, Xtest, ytest, beta, sigma = simulate.changepoint_predictors (n, p, s, snr, k = basis_k, signal = signal, seed = None, bfix = bfix, center_sticky = True,
+                                                                   dtype = precision)
+write_dataset(datafile, X = X, y = y, Xtest = Xtest, ytest = ytest)
@@ -1,5 +1,17 @@
 #
 import simulate
+from dataset import write_dataset
 
 n, p, s = simulate.parse_input_params(dims, sfrac=sfrac, sfix=sfix)
-X, y, Xtest, ytest, beta, sigma = simulate.equicorr_predictors (n, p, s, pve, signal = signal, seed = None, rho = rho, bfix = bfix)
+if design_cache is None:
+    X, y, Xtest, ytest, beta, sigma = simulate.equicorr_predictors (n, p, s, pve, signal = signal, seed = None, rho = rho, bfix = bfix,
+                                                                   dtype = precision)
+    write_dataset(datafile, X = X, y = y, Xtest = Xtest, ytest = ytest)
+else:
+    X, y, Xtest, ytest, beta, sigma = simulate.equicorr_predictors_crn (n, p, s, pve, DSC_REPLICATE, signal = signal, 
+                                                                        seed = crn_seed, rho = rho, bfix = bfix,
+                                                                        cache_dir = design_cache, dtype = precision)
+    # X and Xtest are read from the cached design, only the responses are written
+    write_dataset(datafile, y = y, ytest = ytest,
+                  shared = simulate.equicorr_design_manifest(n, p, rho, DSC_REPLICATE, seed = crn_seed,
+                                                             cache_dir = design_cache, dtype = precision))
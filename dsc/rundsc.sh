@@ -33,6 +33,11 @@ case $1 in
         rm -rf ${OUTDIR} ${OUTDIR}.html
         ${DSC_CMD} linreg.dsc --target ${TARGET} --replicate 1 -c 16 -s none -o trial -o ${OUTDIR}
         ;;
+    "export")
+        # append the new results to the Parquet warehouse
+        # usage: rundsc.sh export <dsc_outdir> <warehouse_dir>
+        python ../analysis/warehouse.py ${2} ${3}
+        ;;
     *)
         ${DSC_CMD} "$@"
         ;;